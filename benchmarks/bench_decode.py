@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Compare namespace_io_stats_info decode paths under each protobuf backend
+
+Run from the repository root:
+    python3 benchmarks/bench_decode.py [--count N]
+
+Each backend is measured in a child process, since the protobuf implementation is fixed when
+the module is first imported.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+backends = ['upb', 'python']
+
+
+def sample_message() -> bytes:
+    import nvmeof_top.proto.gateway_pb2 as pb2
+    return pb2.namespace_io_stats_info(
+        subsystem_nqn='nqn.2016-06.io.spdk:cnode1', nsid=42, uuid='ee889718-8c69-40d3-8e78-5be049f966a6',
+        bdev_name='bdev_ee889718-8c69-40d3-8e78-5be049f966a6', tick_rate=2300000000, ticks=912345678901234,
+        bytes_read=123456789012, num_read_ops=30141357, bytes_written=98765432101, num_write_ops=7654321,
+        read_latency_ticks=555555555555, max_read_latency_ticks=4567890, min_read_latency_ticks=1234,
+        write_latency_ticks=6666666666666, max_write_latency_ticks=9876543, min_write_latency_ticks=2345,
+    ).SerializeToString()
+
+
+def run_backend(count: int):
+    import nvmeof_top.proto.gateway_pb2 as pb2
+    from google.protobuf.internal import api_implementation
+    from nvmeof_top import decode
+
+    data = sample_message()
+
+    def message_attrs():
+        # the original path: decode to a message, then read each field as an attribute
+        stats = pb2.namespace_io_stats_info.FromString(data)
+        return (stats.ticks / stats.tick_rate, stats.num_read_ops, stats.bytes_read, stats.read_latency_ticks,
+                stats.num_write_ops, stats.bytes_written, stats.write_latency_ticks, stats.uuid)
+
+    def message_counters():
+        return decode.decode_counters_message(data)
+
+    def wire_counters():
+        return decode.decode_counters_wire(data)
+
+    selected = decode.select_decoder().__name__
+    for name, func in (('message + attributes', message_attrs), ('decode_counters_message', message_counters),
+                       ('decode_counters_wire', wire_counters)):
+        start = time.perf_counter()
+        for _ in range(count):
+            func()
+        elapsed = time.perf_counter() - start
+        marker = '*' if name == selected else ' '
+        print(f"{api_implementation.Type():<8} {name:<24}{marker} {(elapsed / count) * 1e6:8.2f} us/msg  "
+              f"{count / elapsed:10.0f} msg/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=100000, help="messages to decode per path [100000]")
+    parser.add_argument("--backend", choices=backends, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.backend:
+        run_backend(args.count)
+        return
+
+    print("* marks the decoder selected for that backend")
+    for backend in backends:
+        env = dict(os.environ, PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION=backend)
+        subprocess.run([sys.executable, __file__, '--backend', backend, '--count', str(args.count)], env=env, check=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Compare batch mode row rendering, per row str.format against the cached RowRenderer
+
+Run from the repository root:
+    python3 benchmarks/bench_render.py [--rows N] [--count N]
+
+The renderer is measured cold (first snapshot of a topology, every static cell formatted) and
+warm (later snapshots of the same topology). Both paths must produce identical text.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from nvmeof_top.render import RowRenderer, qos_enabled, text_template  # noqa: E402
+from nvmeof_top.snapshot import IORates, NamespaceRow, Snapshot  # noqa: E402
+from nvmeof_top.utils import bytes_to_MB, lb_group  # noqa: E402
+
+
+def build_snapshot(rows: int, version: int, topology: int) -> Snapshot:
+    rng = random.Random(version)
+    ns_rows = []
+    for nsid in range(1, rows + 1):
+        read_ops, write_ops = rng.uniform(0, 5000), rng.uniform(0, 2000)
+        rates = IORates(read_ops, read_ops * rng.choice((4096, 8192, 65536)), read_ops * rng.uniform(0.0001, 0.005),
+                        write_ops, write_ops * rng.choice((4096, 16384)), write_ops * rng.uniform(0.0005, 0.01))
+        ns_rows.append(NamespaceRow(nsid, f"bdev_{nsid}", f"uuid-{nsid}", f"pool{nsid % 8}", f"image-{nsid:05d}",
+                                    nsid % 4, 1000 if nsid % 10 == 0 else 0, 0, 0, 0, rates, nsid % 97 != 0))
+    return Snapshot(version, time.time(), 1.0, tuple(ns_rows), topology)
+
+
+def legacy_render(snapshot: Snapshot) -> list:
+    """Batch mode rendering before the render cache: every cell formatted for every row"""
+    lines = []
+    for ns in snapshot.rows:
+        rbd_info = f"{ns.rbd_pool_name}/{ns.rbd_image_name}"
+        rates = ns.rates
+        if not ns.valid:
+            row = [ns.nsid, rbd_info] + ['-'] * 9 + [lb_group(ns.load_balancing_group), qos_enabled(ns)]
+        else:
+            row = [ns.nsid, rbd_info, int(rates.total_iops), int(rates.read_ops), f"{bytes_to_MB(rates.read_bytes):3.2f}",
+                   f"{rates.r_await:3.2f}", f"{rates.rareq_sz:4.2f}", int(rates.write_ops),
+                   f"{bytes_to_MB(rates.write_bytes):3.2f}", f"{rates.w_await:3.2f}", f"{rates.wareq_sz:4.2f}",
+                   lb_group(ns.load_balancing_group), qos_enabled(ns)]
+        lines.append(text_template.format(*row))
+    return lines
+
+
+def timed(func, count: int) -> float:
+    start = time.perf_counter()
+    for _ in range(count):
+        func()
+    return (time.perf_counter() - start) / count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5000, help="Namespaces per snapshot [5000]")
+    parser.add_argument("--count", type=int, default=50, help="Renders per measurement [50]")
+    args = parser.parse_args()
+
+    snapshots = [build_snapshot(args.rows, version, topology=1) for version in range(1, 4)]
+    for snapshot in snapshots:
+        if legacy_render(snapshot) != RowRenderer().render(snapshot, list(snapshot.rows)):
+            sys.exit("renderer output differs from the legacy rendering")
+
+    snapshot = snapshots[-1]
+    rows = list(snapshot.rows)
+    warm = RowRenderer()
+    warm.render(snapshots[0], list(snapshots[0].rows))
+
+    results = [
+        ('legacy str.format', timed(lambda: legacy_render(snapshot), args.count)),
+        ('RowRenderer cold', timed(lambda: RowRenderer().render(snapshot, rows), args.count)),
+        ('RowRenderer warm', timed(lambda: warm.render(snapshot, rows), args.count)),
+    ]
+    baseline = results[0][1]
+    for name, secs in results:
+        print(f"{name:<20} {secs * 1000:8.2f} ms/snapshot  {secs / args.rows * 1e6:6.2f} us/row  {baseline / secs:5.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""Run the collector against a simulated gateway in virtual time, checking every published rate
+
+Run from the repository root:
+    python3 benchmarks/bench_simulate.py [--hours N] [--namespaces N] [--delay SECS] [--adaptive]
+                                         [--concurrency N] [--stagger] [--outage-at SECS]
+
+The default scenario is a day with hourly latency spikes, two gateway restarts and regular
+namespace churn (see Scenario.day). Exits non-zero if any row disagrees with the rates derived
+from the samples the gateway served.
+"""
+import argparse
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import nvmeof_top.defaults as DEFAULT  # noqa: E402
+from nvmeof_top.pacing import AdaptiveInterval, ConcurrencyTuner, FixedConcurrency, FixedInterval  # noqa: E402
+from nvmeof_top.sim import Scenario, Window, format_report, simulate  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hours", type=float, default=24, help="Virtual hours to simulate [24]")
+    parser.add_argument("--namespaces", type=int, default=20, help="Namespaces on the simulated gateway [20]")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for workloads and churn [1]")
+    parser.add_argument("--delay", type=float, default=DEFAULT.delay, help=f"Refresh interval (secs) [{DEFAULT.delay}]")
+    parser.add_argument("--adaptive", action='store_true', default=False, help="Use the adaptive interval")
+    parser.add_argument("--concurrency", type=int, default=0, help="Fixed RPC concurrency, 0 to tune from latency [0]")
+    parser.add_argument("--stagger", action='store_true', default=False, help="Stagger namespace RPCs across the interval")
+    parser.add_argument("--outage-at", type=float, metavar='SECS', help="Make the gateway unreachable for a minute from SECS")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    scenario = Scenario.day(args.namespaces, args.seed)
+    if args.outage_at is not None:
+        scenario.outages.append(Window(args.outage_at, 60))
+    if args.adaptive:
+        pacer = AdaptiveInterval(args.delay, DEFAULT.min_delay, DEFAULT.max_delay)
+    else:
+        pacer = FixedInterval(args.delay)
+    if args.concurrency:
+        concurrency = FixedConcurrency(args.concurrency)
+    else:
+        concurrency = ConcurrencyTuner(max_limit=DEFAULT.max_concurrency)
+
+    check, wall_secs = simulate(scenario, args.hours * 3600, pacer, concurrency, stagger=args.stagger)
+    print(format_report(check, wall_secs), end='')
+    if not check.passed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
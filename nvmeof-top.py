@@ -3,29 +3,97 @@ import sys
 import argparse
 from nvmeof_top import NVMeoFTop
 from nvmeof_top.grpc import GatewayClient
-from nvmeof_top.utils import valid_nqn
+from nvmeof_top.utils import concurrency_limit, non_negative_int, nsid_list, positive_float, positive_int, time_window, timestamp, valid_nqn, valid_pattern
 import nvmeof_top.defaults as DEFAULT
-import logging
-
-logging.basicConfig(
-    filename='nvmeof-top.log',
-    filemode='w',
-    format='%(asctime)s - %(levelname)-8s - %(name)s.%(funcName)s - %(msg)s')
+from nvmeof_top.logs import setup_logging
 
 
 def parse_arguments() -> argparse.Namespace:
     parser = argparse.ArgumentParser()
-    parser.add_argument("--delay", "-d", type=int, default=DEFAULT.delay, help=f"Refresh interval (secs) [{DEFAULT.delay}]")
-    parser.add_argument("--mode", "-m", type=str, choices=['batch', 'console'], default='batch', help=f"Run time mode [{DEFAULT.mode}]")
+    parser.add_argument("--delay", "-d", type=positive_float, default=DEFAULT.delay, help=f"Refresh interval (secs), fractions allowed [{DEFAULT.delay}]")
+    parser.add_argument("--warmup", type=positive_float, default=DEFAULT.warmup_interval, help=f"Interval (secs) between the first two samples, so the first figures are shown quickly [{DEFAULT.warmup_interval}]")
+    parser.add_argument("--adaptive", action='store_true', default=False, help="Back off the refresh interval when the gateway is slow to respond, returning to --delay when quiet")
+    parser.add_argument("--min-delay", type=positive_float, default=DEFAULT.min_delay, help=f"Lower bound for the refresh interval in adaptive mode (secs) [{DEFAULT.min_delay}]")
+    parser.add_argument("--max-delay", type=positive_float, default=DEFAULT.max_delay, help=f"Upper bound for the refresh interval in adaptive mode (secs) [{DEFAULT.max_delay}]")
+    parser.add_argument("--mode", "-m", type=str, choices=['batch', 'console', 'daemon'], default='batch', help=f"Run time mode. console shows a namespace x time heatmap, daemon serves snapshots to --attach clients over --socket [{DEFAULT.mode}]")
     parser.add_argument("--subsystem", "-n", type=valid_nqn, help="NQN of the subsystem to monitor (REQUIRED)", required=True)
     parser.add_argument("--server-addr", "-a", type=str, help="Gateway server IP address", default=DEFAULT.server_addr)
     parser.add_argument("--server-port", "-p", type=int, help="Gateway server control path port", default=DEFAULT.server_port)
+    parser.add_argument("--nsid", type=valid_pattern, action='append', metavar='PATTERN', help="Only collect namespaces whose nsid matches PATTERN (glob, or regex with a 're:' prefix). May be repeated")
+    parser.add_argument("--pool", type=valid_pattern, action='append', metavar='PATTERN', help="Only collect namespaces whose RBD pool matches PATTERN (glob, or regex with a 're:' prefix). May be repeated")
+    parser.add_argument("--image", type=valid_pattern, action='append', metavar='PATTERN', help="Only collect namespaces whose RBD image matches PATTERN (glob, or regex with a 're:' prefix). May be repeated")
+    parser.add_argument("--burst-nsid", type=nsid_list, metavar='NSID[,NSID...]', help="Sample these namespaces at --burst-interval, reporting peaks for each refresh interval in batch mode")
+    parser.add_argument("--burst-interval", type=positive_float, default=DEFAULT.burst_interval, help=f"Sampling interval (secs) for --burst-nsid [{DEFAULT.burst_interval}]")
+    parser.add_argument("--stagger", action='store_true', default=False, help="Spread namespace IO stats RPCs across the refresh interval instead of issuing them in one burst")
+    parser.add_argument("--concurrency", type=concurrency_limit, default=DEFAULT.concurrency, help=f"Namespace IO stats RPCs in flight at once, or 'auto' to tune from RPC latency [{DEFAULT.concurrency}]")
+    parser.add_argument("--max-concurrency", type=positive_int, default=DEFAULT.max_concurrency, help=f"Upper bound for --concurrency auto [{DEFAULT.max_concurrency}]")
+    parser.add_argument("--evict-after", type=positive_int, default=DEFAULT.evict_after, help=f"Discard stats for namespaces not seen for this many refresh cycles [{DEFAULT.evict_after}]")
+    parser.add_argument("--max-entries", type=non_negative_int, default=DEFAULT.max_entries, help=f"Cap the number of namespaces tracked, dropping the least recently seen (0 = no limit) [{DEFAULT.max_entries}]")
+    parser.add_argument("--diagnostics", action='store_true', default=False, help="Show nvmeof-top's own memory use and collector state after each interval in batch mode")
+    parser.add_argument("--socket", type=str, default=DEFAULT.socket, help=f"Unix socket used by daemon mode and --attach [{DEFAULT.socket}]")
+    parser.add_argument("--attach", action='store_true', default=False, help="Display snapshots from an nvmeof-top daemon instead of polling the gateway")
+    parser.add_argument("--record", type=str, metavar='DIR', help="Write every snapshot to compressed, rotated segment files in DIR")
+    parser.add_argument("--record-segment-size", type=positive_float, default=DEFAULT.record_segment_size, help=f"Start a new recording segment after this many MiB of (uncompressed) snapshots [{DEFAULT.record_segment_size}]")
+    parser.add_argument("--record-segment-age", type=positive_float, default=DEFAULT.record_segment_age, help=f"Start a new recording segment after this many seconds [{DEFAULT.record_segment_age}]")
+    parser.add_argument("--record-max-size", type=positive_float, default=DEFAULT.record_max_size, help=f"Delete the oldest recording segments to keep DIR under this many MiB [{DEFAULT.record_max_size}]")
+    parser.add_argument("--replay", type=str, metavar='DIR', help="Print snapshots from a --record directory in batch mode instead of polling the gateway")
+    parser.add_argument("--start", type=timestamp, metavar='TIME', help="With --replay, skip snapshots before TIME (epoch secs or 'YYYY-MM-DD HH:MM:SS')")
+    parser.add_argument("--end", type=timestamp, metavar='TIME', help="With --replay, stop at TIME (epoch secs or 'YYYY-MM-DD HH:MM:SS')")
+    parser.add_argument("--before", type=time_window, metavar='START,END', help="Compare this window against --after, using --replay DIR or --api-url as the source, and exit")
+    parser.add_argument("--after", type=time_window, metavar='START,END', help="Window to compare against --before")
+    parser.add_argument("--api-url", type=str, metavar='URL', help="Read --before/--after windows from the query API of a running nvmeof-top, e.g. http://127.0.0.1:8080")
+    parser.add_argument("--compare-top", type=int, default=DEFAULT.compare_top, help=f"Number of the most significant changes to show when comparing windows [{DEFAULT.compare_top}]")
+    parser.add_argument("--history", type=int, default=DEFAULT.history, help=f"Number of refresh intervals of per namespace history to keep in memory [{DEFAULT.history}]")
+    parser.add_argument("--console-metric", type=str, choices=['iops', 'mbps', 'await'], default=DEFAULT.console_metric, help=f"Metric shown by the console mode heatmap, 'm' cycles through them [{DEFAULT.console_metric}]")
+    parser.add_argument("--api-port", type=int, default=0, help="Serve a read-only HTTP/JSON query API over the in-memory history on this port (0 disables) [0]")
+    parser.add_argument("--api-addr", type=str, default=DEFAULT.api_addr, help=f"Address the query API listens on [{DEFAULT.api_addr}]")
+    parser.add_argument("--web-port", type=int, default=0, help="Serve a browser dashboard of the live table, sparklines and pool/LB group roll-ups on this port (0 disables) [0]")
+    parser.add_argument("--web-addr", type=str, default=DEFAULT.web_addr, help=f"Address the web dashboard listens on [{DEFAULT.web_addr}]")
     parser.add_argument("--with-timestamp", action='store_true', default=False, help="Prefix namespaces statistics with a timestamp in batch mode")
     parser.add_argument("--no-headings", action='store_true', default=False, help="Omit column headings in batch mode")
+    parser.add_argument("--active-only", action='store_true', default=False, help="Only show namespaces with IO in the interval in batch mode")
+    parser.add_argument("--changes-only", action='store_true', default=False, help="Only show namespaces whose IOPS, throughput or await moved by more than --change-threshold since last shown, in batch mode")
+    parser.add_argument("--change-threshold", type=positive_float, default=DEFAULT.change_threshold, help=f"Percentage change that counts as a change for --changes-only [{DEFAULT.change_threshold}]")
+    parser.add_argument("--heartbeat", type=int, default=DEFAULT.heartbeat, help=f"With --active-only/--changes-only, print a one line heartbeat after this many intervals with nothing to show (0 disables) [{DEFAULT.heartbeat}]")
+    parser.add_argument("--output-queue", type=int, default=DEFAULT.output_queue, help=f"Intervals of batch output that may wait for a slow stdout before --output-policy applies [{DEFAULT.output_queue}]")
+    parser.add_argument("--output-policy", type=str, choices=['drop-oldest', 'drop-newest', 'coalesce'], default=DEFAULT.output_policy, help=f"What to do with batch output when stdout falls --output-queue intervals behind; coalesce merges intervals instead of dropping them [{DEFAULT.output_policy}]")
     parser.add_argument("--count", "-c", type=int, help="Number of interations for stats gathering")
+    parser.add_argument("--analytics", type=str, choices=['off', 'thread', 'process'], default=DEFAULT.analytics, help=f"Run pool/LB group aggregation, latency percentiles and anomaly detection in a worker thread or process [{DEFAULT.analytics}]")
+    parser.add_argument("--forecast", type=positive_float, metavar='HORIZON', help="Fit a trend to IOPS and total, read and write MB/s per namespace, pool and LB group, and report in batch mode what will reach its QoS limit or --capacity-* within HORIZON secs")
+    parser.add_argument("--capacity-iops", type=positive_float, help="Gateway IOPS capacity that pool, LB group and subsystem totals are forecast against")
+    parser.add_argument("--capacity-mbps", type=positive_float, help="Gateway MB/s capacity that pool, LB group and subsystem totals are forecast against")
+    parser.add_argument("--trace-on-spike", action='store_true', default=False, help="When a namespace's await spikes, raise the gateway's SPDK nvmf logging for --trace-window secs, then restore the previous flags (the level can only be restored when flags were enabled)")
+    parser.add_argument("--trace-window", type=positive_float, default=DEFAULT.trace_window, help=f"Length of an SPDK nvmf trace capture (secs) [{DEFAULT.trace_window}]")
+    parser.add_argument("--trace-cooldown", type=positive_float, default=DEFAULT.trace_cooldown, help=f"Minimum time between trace captures (secs) [{DEFAULT.trace_cooldown}]")
+    parser.add_argument("--spike-factor", type=positive_float, default=DEFAULT.spike_factor, help=f"An await this many times the namespace's baseline counts as a spike [{DEFAULT.spike_factor}]")
+    parser.add_argument("--spike-min-await", type=positive_float, default=DEFAULT.spike_min_await, help=f"Awaits below this (ms) never count as a spike [{DEFAULT.spike_min_await}]")
+    parser.add_argument("--trace-level", type=str, choices=['error', 'warning', 'notice', 'info', 'debug'], default=DEFAULT.trace_level, help=f"SPDK log and print level used during a trace capture [{DEFAULT.trace_level}]")
+    parser.add_argument("--profile", action='store_true', default=False, help="Record per-stage timings of nvmeof-top itself, reporting percentiles at exit")
+    parser.add_argument("--profile-dump", type=str, metavar='FILE', help="With --profile, also write cProfile data for the collector and output threads to FILE (pstats format)")
+    parser.add_argument("--log-file", type=str, default=DEFAULT.log_file, help=f"File to append log messages to, rotated at {DEFAULT.log_max_bytes // (1024 * 1024)} MiB [{DEFAULT.log_file}]")
     parser.add_argument("--log-level", type=str, choices=['debug', 'info', 'warning', 'error', 'critical'], default=DEFAULT.log_level, help=f"Logging level [{DEFAULT.log_level}]")
 
     args = parser.parse_args()
+    if args.min_delay > args.max_delay:
+        parser.error("--min-delay must not be greater than --max-delay")
+    if args.attach and args.mode == 'daemon':
+        parser.error("--attach can not be used in daemon mode")
+    if args.attach and (args.burst_nsid or args.trace_on_spike):
+        parser.error("--burst-nsid and --trace-on-spike need a gateway connection, so can not be used with --attach")
+    if args.burst_nsid and args.mode != 'batch':
+        parser.error("--burst-nsid peaks are only reported in batch mode")
+    if args.output_queue < 1:
+        parser.error("--output-queue must be at least 1")
+    if args.history < 2:
+        parser.error("--history must be at least 2")
+    if bool(args.before) != bool(args.after):
+        parser.error("--before and --after must be used together")
+    if args.before and bool(args.replay) == bool(args.api_url):
+        parser.error("comparing windows needs one source, either --replay DIR or --api-url URL")
+    if args.api_url and not args.before:
+        parser.error("--api-url is only used with --before/--after")
+    if args.replay and (args.attach or args.record or args.burst_nsid or args.api_port or args.web_port or args.trace_on_spike or args.mode != 'batch'):
+        parser.error("--replay runs in batch mode on its own, without --attach, --record, --burst-nsid, --api-port or --web-port")
 
     return args
 
@@ -33,18 +101,20 @@ def parse_arguments() -> argparse.Namespace:
 if __name__ == "__main__":
     args = parse_arguments()
 
-    if not args.server_addr or not args.server_port:
-        print("IP and port required: Either set SERVER_ADDR and SERVER_PORT environment variables or provide them as parameters")
-        sys.exit(4)
+    # configured here rather than at import, so spawned analytics workers leave the log alone
+    setup_logging(args.log_file, args.log_level, DEFAULT.log_max_bytes, DEFAULT.log_backups)
 
-    # set the root loggers default log level
-    logging.getLogger().setLevel(args.log_level.upper())
+    gateway_client = None
+    if not args.attach and not args.replay and not args.before:
+        if not args.server_addr or not args.server_port:
+            print("IP and port required: Either set SERVER_ADDR and SERVER_PORT environment variables or provide them as parameters")
+            sys.exit(4)
 
-    gateway_client = GatewayClient(
-        server_addr=args.server_addr,
-        server_port=args.server_port
-    )
-    gateway_client.connect()
+        gateway_client = GatewayClient(
+            server_addr=args.server_addr,
+            server_port=args.server_port
+        )
+        gateway_client.connect()
 
     app = NVMeoFTop(args, gateway_client)
 
@@ -0,0 +1,134 @@
+import math
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from nvmeof_top.snapshot import Snapshot
+from nvmeof_top.utils import bytes_to_MB, lb_group, percentile
+from typing import Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# EWMA baselines used for anomaly detection, keyed by bdev name. This state lives in whichever
+# process runs summarise(), which is why the executors below only ever use a single worker.
+_baselines: Dict[str, Tuple[float, float, int]] = {}
+
+ewma_alpha = 0.1
+anomaly_threshold = 3.0  # standard deviations
+anomaly_warmup = 5       # samples before a baseline is trusted
+
+
+def _is_anomaly(bdev: str, value: float) -> bool:
+    """Update the EWMA baseline for a bdev, returning True when the value is an outlier"""
+    mean, var, count = _baselines.get(bdev, (value, 0.0, 0))
+    deviation = value - mean
+    anomaly = count >= anomaly_warmup and var > 0 and abs(deviation) > anomaly_threshold * math.sqrt(var)
+
+    mean += ewma_alpha * deviation
+    var = (1 - ewma_alpha) * (var + ewma_alpha * deviation * deviation)
+    _baselines[bdev] = (mean, var, count + 1)
+    return anomaly
+
+
+def summarise(timestamp: float, rows: List[tuple]) -> dict:
+    """Aggregate a snapshot's rows by pool and LB group, with latency percentiles and anomalies
+
+    rows are plain tuples of (bdev, nsid, pool, lb_group, iops, bytes/s, r_await, w_await) so they
+    can be pickled cheaply when this runs in a worker process.
+    """
+    pools: Dict[str, List[float]] = {}
+    lb_groups: Dict[str, List[float]] = {}
+    r_awaits = []
+    w_awaits = []
+    anomalies = []
+
+    for bdev, nsid, pool, grp, iops, bytes_sec, r_await, w_await in rows:
+        for key, totals in ((pool, pools), (lb_group(grp), lb_groups)):
+            agg = totals.setdefault(key, [0.0, 0.0])
+            agg[0] += iops
+            agg[1] += bytes_sec
+        if r_await:
+            r_awaits.append(r_await)
+        if w_await:
+            w_awaits.append(w_await)
+        if _is_anomaly(bdev, iops):
+            anomalies.append(nsid)
+
+    live = {row[0] for row in rows}
+    for bdev in [bdev for bdev in _baselines if bdev not in live]:
+        del _baselines[bdev]
+
+    r_awaits.sort()
+    w_awaits.sort()
+    return {
+        'timestamp': timestamp,
+        'pools': pools,
+        'lb_groups': lb_groups,
+        'r_await': tuple(percentile(r_awaits, pct) for pct in (50, 90, 99)),
+        'w_await': tuple(percentile(w_awaits, pct) for pct in (50, 90, 99)),
+        'anomalies': sorted(anomalies),
+    }
+
+
+def format_summary(summary: dict, previous: bool = False) -> str:
+    """Render an analytics summary as text for batch mode
+
+    previous labels a summary that belongs to the interval before the table it is shown with,
+    since analysis of the latest snapshot may still be running.
+    """
+    def totals(data: Dict[str, List[float]]) -> str:
+        return ", ".join(f"{key} {int(iops)} IOPS {bytes_to_MB(bytes_sec):3.2f} MB/s" for key, (iops, bytes_sec) in sorted(data.items()))
+
+    lines = ["Analytics for the previous interval:"] if previous else []
+    lines += [
+        f"Pools: {totals(summary['pools'])}",
+        f"LB groups: {totals(summary['lb_groups'])}",
+        "await p50/p90/p99 (ms): read {:3.2f}/{:3.2f}/{:3.2f}  write {:3.2f}/{:3.2f}/{:3.2f}".format(
+            *summary['r_await'], *summary['w_await']),
+    ]
+    if summary['anomalies']:
+        lines.append(f"IOPS anomalies: nsid {', '.join(str(nsid) for nsid in summary['anomalies'])}")
+    return "\n".join(lines) + "\n"
+
+
+class Analytics:
+    """Run snapshot analytics off the collection thread
+
+    In 'process' mode the work runs in a separate interpreter, so heavy analytics across large
+    namespace counts never competes with the collector for the GIL.
+    """
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        if mode == 'process':
+            # spawn rather than fork, since the parent is multi-threaded and holds a grpc channel
+            self.executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='analytics')
+        self.summary: Optional[dict] = None
+        self.skipped = 0
+        self._pending: Optional[Future] = None
+
+    def submit(self, snapshot: Snapshot):
+        """Queue a snapshot for analysis, skipping it if the previous one is still in progress"""
+        if self._pending and not self._pending.done():
+            self.skipped += 1
+            logger.warning(f"analytics busy, skipped snapshot ({self.skipped} skipped so far)")
+            return
+
+        rows = [
+            (row.bdev_name, row.nsid, row.rbd_pool_name, row.load_balancing_group, row.rates.total_iops,
+             row.rates.read_bytes + row.rates.write_bytes, row.rates.r_await, row.rates.w_await)
+            for row in snapshot.rows if row.valid
+        ]
+
+        self._pending = self.executor.submit(summarise, snapshot.timestamp, rows)
+        self._pending.add_done_callback(self._store)
+
+    def _store(self, future: Future):
+        try:
+            self.summary = future.result()
+        except Exception:
+            logger.exception("analytics failed")
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
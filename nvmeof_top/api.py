@@ -0,0 +1,180 @@
+import json
+import math
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+from nvmeof_top.history import History, downsample
+from nvmeof_top.snapshot import IORates, NamespaceRow
+from nvmeof_top.utils import bytes_to_MB, lb_group
+from typing import Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# /history/<scope>/<key> selects namespaces by one of these
+scopes = {
+    'namespace': lambda row, key: str(row.nsid) == key,
+    'pool': lambda row, key: row.rbd_pool_name == key,
+    # keyed as the table shows groups, N/A when ungrouped, with the raw 0 also accepted
+    'lbgroup': lambda row, key: key in (lb_group(row.load_balancing_group), str(row.load_balancing_group)),
+}
+
+# finer steps than this only split cycles that are already kept apart by step=0
+min_step = 0.001
+
+
+class QueryError(Exception):
+    def __init__(self, status: int, msg: str):
+        super().__init__(msg)
+        self.status = status
+
+
+def _point(timestamp: float, rates: Optional[IORates]) -> Dict:
+    if rates is None:
+        return {'timestamp': timestamp, 'samples': False}
+    return {
+        'timestamp': timestamp,
+        'samples': True,
+        'iops': rates.total_iops,
+        'read_ops': rates.read_ops,
+        'write_ops': rates.write_ops,
+        'read_mbps': bytes_to_MB(rates.read_bytes),
+        'write_mbps': bytes_to_MB(rates.write_bytes),
+        'r_await': rates.r_await,
+        'w_await': rates.w_await,
+    }
+
+
+def _namespace(row: NamespaceRow) -> Dict:
+    return {
+        'nsid': row.nsid,
+        'bdev_name': row.bdev_name,
+        'uuid': row.uuid,
+        'rbd_pool_name': row.rbd_pool_name,
+        'rbd_image_name': row.rbd_image_name,
+        'load_balancing_group': row.load_balancing_group,
+    }
+
+
+def _float_param(params: Dict[str, List[str]], name: str, default: float) -> float:
+    if name not in params:
+        return default
+    try:
+        value = float(params[name][-1])
+    except ValueError:
+        raise QueryError(400, f"{name} must be a number")
+    if not math.isfinite(value):
+        raise QueryError(400, f"{name} must be a finite number")
+    return value
+
+
+class QueryServer:
+    """Read-only HTTP/JSON API over the in-memory History
+
+    GET /namespaces lists the namespaces in the history. GET /history/<scope>/<key> returns the
+    summed rates of the namespaces matching a namespace id, pool or LB group (as the table shows
+    it, so N/A, URL encoded as N%2FA, or 0 for ungrouped namespaces), with optional
+    start/end (epoch secs, or negative for seconds before the latest cycle) and step (secs) to
+    downsample on the server. Responses are cached until the next cycle is recorded, so any
+    number of scripts can poll without adding gateway RPCs.
+    """
+
+    def __init__(self, history: History, addr: str, port: int):
+        self.history = history
+        self.addr = addr
+        self.port = port
+        self.cache: Dict[str, bytes] = {}
+        self.cache_version = -1
+        self.cache_lock = threading.Lock()
+        self._httpd: Optional[ThreadingHTTPServer] = None
+
+    def start(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                status, body = server.respond(self.path)
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug("%s " + format, self.address_string(), *args)
+
+        self._httpd = ThreadingHTTPServer((self.addr, self.port), Handler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        threading.Thread(target=self._httpd.serve_forever, name='query-api', daemon=True).start()
+        logger.info(f"query API listening on http://{self.addr}:{self.port}")
+
+    def stop(self):
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def respond(self, path: str) -> Tuple[int, bytes]:
+        """Return the status and JSON body for a request path, from the cache where possible"""
+        # the history version changes once per cycle, so it acts as the cache generation
+        version = self.history.version
+        with self.cache_lock:
+            if version != self.cache_version:
+                self.cache = {}
+                self.cache_version = version
+            body = self.cache.get(path)
+        if body is not None:
+            return 200, body
+
+        try:
+            body = json.dumps(self.query(path, version)).encode()
+        except QueryError as err:
+            return err.status, json.dumps({'error': str(err)}).encode()
+        except Exception as err:
+            logger.warning("query %s failed: %s", path, err)
+            return 400, json.dumps({'error': f"query failed: {err}"}).encode()
+
+        with self.cache_lock:
+            if self.cache_version == version:
+                self.cache[path] = body
+        return 200, body
+
+    def query(self, path: str, version: int) -> Dict:
+        url = urlsplit(path)
+        params = parse_qs(url.query)
+        parts = [unquote(part) for part in url.path.split('/') if part]
+        with self.history.lock:
+            rows = list(self.history.rows.values())
+
+        if parts == ['namespaces']:
+            return {'cycle': version, 'namespaces': [_namespace(row) for row in sorted(rows, key=lambda row: row.nsid)]}
+
+        if len(parts) != 3 or parts[0] != 'history' or parts[1] not in scopes:
+            raise QueryError(404, "use /namespaces or /history/{namespace,pool,lbgroup}/<key>")
+
+        scope, key = parts[1], parts[2]
+        members = [row.bdev_name for row in rows if scopes[scope](row, key)]
+        if not members:
+            raise QueryError(404, f"no namespaces found for {scope} {key}")
+
+        latest = self.history.timestamps[(self.history.head - 1) % self.history.depth]
+        start = _float_param(params, 'start', -math.inf)
+        end = _float_param(params, 'end', math.inf)
+        step = _float_param(params, 'step', 0)
+        if step < 0 or 0 < step < min_step:
+            raise QueryError(400, f"step must be 0, or at least {min_step} secs")
+        if start < 0 and start != -math.inf:
+            start += latest
+        if end < 0:
+            end += latest
+
+        timestamps, sums, samples = self.history.aggregate(members, start, end)
+        return {
+            'cycle': version,
+            'scope': scope,
+            'key': key,
+            'namespaces': len(members),
+            'step': step,
+            'points': [_point(timestamp, rates) for timestamp, rates in downsample(timestamps, sums, samples, step)],
+        }
@@ -1,139 +1,393 @@
 import argparse
 from .grpc import GatewayClient
-from nvmeof_top.collector import DataCollector
-from nvmeof_top.utils import bytes_to_MB, lb_group
+from nvmeof_top.api import QueryServer
+from nvmeof_top.analytics import Analytics, format_summary
+from nvmeof_top.burst import BurstSampler
+from nvmeof_top.compare import Window, compare, format_changes
+from nvmeof_top.collector import DataCollector, SnapshotSource
+from nvmeof_top.filters import RowFilter
+from nvmeof_top.forecast import SaturationForecaster, format_forecasts
+from nvmeof_top.heatmap import HeatmapScreen
+from nvmeof_top.history import History
+from nvmeof_top.daemon import DaemonClient, SnapshotServer
+from nvmeof_top.pacing import AdaptiveInterval, ConcurrencyTuner, FixedConcurrency, FixedInterval
+from nvmeof_top.profiler import Profiler
+from nvmeof_top.recorder import Recorder, RecordingReader
+from nvmeof_top.render import RowRenderer, heading
+from nvmeof_top.selector import NamespaceSelector
+from nvmeof_top.sink import OutputSink
+from nvmeof_top.snapshot import Snapshot
+from nvmeof_top.tracer import TraceCapture, format_event
+from nvmeof_top.utils import bytes_to_MB
+from nvmeof_top.web import Dashboard
+import curses
+import os
+import signal
 import threading
 import time
-from typing import List
+from typing import Dict, Optional
 import sys
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-class NVMeoFTop:
-    text_headers = ['NSID', 'RBD pool/image', 'IOPS', 'r/s', 'rMB/s', 'r_await', 'rareq-sz', 'w/s', 'wMB/s', 'w_await', 'wareq-sz', 'LBGrp', 'QoS']
-    text_template = "{:>4}  {:<32}    {:>7}  {:>6}   {:>6}  {:>7}  {:>8}  {:>6}  {:>6}  {:>7}  {:>8}  {:^5}   {:>3}\n"
+def _raise_interrupt(signum, frame):
+    """Treat SIGTERM like ctrl-c, so a service manager's stop runs the same cleanup
+
+    That is, a daemon removes its socket and an open trace capture window restores the
+    gateway's SPDK logging.
+    """
+    raise KeyboardInterrupt
 
-    def __init__(self, args: argparse.Namespace, client: GatewayClient):
+
+class NVMeoFTop:
+    def __init__(self, args: argparse.Namespace, client: Optional[GatewayClient]):
         self.client = client
         self.args = args
-        self.collector: DataCollector
+        self.collector: SnapshotSource
+        self.analytics: Optional[Analytics] = None
+        self.collector_thread: Optional[threading.Thread] = None
+        self.burst: Optional[BurstSampler] = None
+        self.recorder: Optional[Recorder] = None
+        self.history: Optional[History] = None
+        self.api: Optional[QueryServer] = None
+        self.web: Optional[Dashboard] = None
+        self.sink: Optional[OutputSink] = None
+        self.forecaster: Optional[SaturationForecaster] = None
+        self.tracer: Optional[TraceCapture] = None
+        self.profiler = Profiler(enabled=args.profile, pstats_file=args.profile_dump)
+        self.row_filter = RowFilter(active_only=args.active_only, changes_only=args.changes_only,
+                                    threshold=args.change_threshold / 100)
+        self._quiet_intervals = 0
+        self._shut_down = False
+        self.renderer = RowRenderer()
 
-    def to_stdout(self):
+    def to_stdout(self, snapshot: Snapshot):
         """Dump information to stdout"""
         logger.debug("writing stats to stdout")
-        with self.collector.lock:
-            ns_data = self.collector.namespaces
 
+        with self.profiler.stage('format'):
+            output = self.format_snapshot(snapshot)
+        with self.profiler.stage('write'):
+            print(output, end='')
+
+    def format_snapshot(self, snapshot: Snapshot) -> str:
+        """Render a snapshot as the batch mode text table"""
         rows = []
-        if self.args.with_timestamp:
-            tstamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.collector.timestamp))
-            rows.append(f"{tstamp}\n")
-        if not self.args.no_headings:
-            rows.append(NVMeoFTop.text_template.format(*NVMeoFTop.text_headers))
-        if ns_data:
-            ns_data.sort(key=lambda x: x.nsid, reverse=False)
-            for ns in ns_data:
-                row = self.build_ns_row(ns)
-                rows.append(NVMeoFTop.text_template.format(*row))
+        ns_rows = self.row_filter.select(snapshot)
+        tstamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(snapshot.timestamp))
+        if ns_rows or not self.row_filter.active:
+            self._quiet_intervals = 0
+            if self.args.with_timestamp:
+                rows.append(f"{tstamp}\n")
+            if not self.args.no_headings:
+                rows.append(heading)
         else:
-            rows.append("<no namespaces defined>")
+            self._quiet_intervals += 1
+            if self.args.heartbeat and self._quiet_intervals % self.args.heartbeat == 0:
+                active = sum(1 for row in snapshot.rows if row.rates.total_iops)
+                rows.append(f"{tstamp} heartbeat: {len(snapshot.rows)} namespaces, {active} active, no rows to report\n")
 
-        print(''.join(rows), end='')
+        if ns_rows:
+            rows.extend(self.renderer.render(snapshot, ns_rows))
+        elif not snapshot.rows:
+            rows.append("<no namespaces defined>\n")
 
-    def build_ns_row(self, ns) -> List[str]:
+        summary = self.analytics.summary if self.analytics else None
+        if summary:
+            rows.append(format_summary(summary, previous=summary['timestamp'] != snapshot.timestamp))
 
-        rbd_info = f"{ns.rbd_pool_name}/{ns.rbd_image_name}"
-        bdev_name = ns.bdev_name
+        if self.forecaster:
+            rows.append(format_forecasts(self.forecaster))
 
-        perf_stats = self.collector.iostats[bdev_name]
-        logger.debug(f"building row for namespace {ns.nsid} from {self.args.subsystem}")
+        if self.tracer:
+            rows.extend(f"{event}\n" for event in self.tracer.drain_events())
 
-        read_ops = perf_stats.read_ops.rate(self.args.delay)
-        read_secs = perf_stats.read_secs.rate(self.args.delay)
-        read_bytes = perf_stats.read_bytes.rate(self.args.delay)
-        write_ops = perf_stats.write_ops.rate(self.args.delay)
-        write_secs = perf_stats.write_secs.rate(self.args.delay)
-        write_bytes = perf_stats.write_bytes.rate(self.args.delay)
-        total_iops = read_ops + write_ops
+        if self.burst:
+            rows.append(self.burst.format_peaks(self.burst.drain_peaks()))
 
-        if read_ops:
-            rareq_sz = (int(read_bytes / read_ops) / 1024)
-            r_await = ((read_secs / read_ops) * 1000)  # for ms
-        else:
-            rareq_sz = 0.0
-            r_await = 0.0
-        if write_ops:
-            wareq_sz = (int(write_bytes / write_ops) / 1024)
-            w_await = ((write_secs / write_ops) * 1000)  # for ms
-        else:
-            wareq_sz = 0.0
-            w_await = 0.0
-
-        return [
-            ns.nsid,
-            rbd_info,
-            int(total_iops),
-            int(read_ops),
-            f"{bytes_to_MB(read_bytes):3.2f}",
-            f"{r_await:3.2f}",
-            f"{rareq_sz:4.2f}",
-            int(write_ops),
-            f"{bytes_to_MB(write_bytes):3.2f}",
-            f"{w_await:3.2f}",
-            f"{wareq_sz:4.2f}",
-            lb_group(ns.load_balancing_group),
-            self.qos_enabled(ns)
-        ]
-
-    def qos_enabled(self, ns) -> str:
-        if (ns.rw_ios_per_second or ns.rw_mbytes_per_second or ns.r_mbytes_per_second or ns.w_mbytes_per_second):
-            return "Yes"
-        return "No"
+        if self.args.diagnostics and not self.args.replay:
+            rows.append(self.format_diagnostics(self.collector.diagnostics()))
+            if self.sink:
+                rows.append(f"output: {self.sink.dropped} intervals dropped, {self.sink.coalesced} coalesced ({self.sink.policy})\n")
+
+        return ''.join(rows)
+
+    def format_diagnostics(self, diagnostics: Dict[str, float]) -> str:
+        return "collector: {} entries, {} evicted, rss {:3.1f} MiB, interval {:3.2f}s, rpc concurrency {}\n".format(
+            diagnostics['entries'], diagnostics['evicted'], bytes_to_MB(diagnostics['rss_bytes']), diagnostics['interval'],
+            diagnostics['concurrency'])
 
     def console_mode(self):
         logger.info(f"Running in console mode: {self.args.subsystem}")
-        pass
+        try:
+            curses.wrapper(self._console_loop)
+        except KeyboardInterrupt:
+            logger.info("nvmeof-top stopped by user")
+
+        self.shutdown()
+        if not self.collector.ready:
+            self.abort(self.collector.health.rc, self.collector.health.msg)
+        print("nvmeof-top stopped.")
+
+    def _console_loop(self, stdscr):
+        screen = HeatmapScreen(stdscr, self.history, self.args.console_metric)
+        stdscr.timeout(0)
+        version = 0
+        screen.draw()
+        while self.collector.ready:
+            # short waits keep the keyboard responsive between snapshots
+            snapshot = self.collector.wait_for_snapshot(version, timeout=0.2)
+            redraw = False
+            if snapshot:
+                version = snapshot.version
+                screen.heatmap.push(snapshot)
+                redraw = True
+            key = stdscr.getch()
+            while key != -1:
+                if not screen.handle_key(key):
+                    return
+                redraw = True
+                key = stdscr.getch()
+            if redraw:
+                screen.draw()
+
+    def daemon_mode(self):
+        logger.info(f"Running in daemon mode: {self.args.subsystem}")
+        server = SnapshotServer(self.collector, self.args.socket, self.args.subsystem)
+        try:
+            server.start()
+        except (OSError, RuntimeError) as err:
+            self.shutdown()
+            print(f"Unable to serve on {self.args.socket}: {err}")
+            sys.exit(4)
+
+        print(f"nvmeof-top daemon serving {self.args.subsystem} on {self.args.socket}")
+        try:
+            while self.collector.ready and self.collector_thread.is_alive():
+                self.collector_thread.join(timeout=1)
+        except KeyboardInterrupt:
+            logger.info("nvmeof-top daemon stopped by user")
+
+        server.stop()
+        self.shutdown()
+        if not self.collector.ready:
+            self.abort(self.collector.health.rc, self.collector.health.msg)
+        print("\nnvmeof-top stopped.")
 
     def batch_mode(self):
         logger.info(f"Running in batch mode: {self.args.subsystem}")
-        event = threading.Event()
-        ctr = 0
+        self.sink = OutputSink(self.format_snapshot, sys.stdout, self.args.output_queue, self.args.output_policy,
+                               self.profiler)
         try:
-            print("waiting for samples...")
-            while not event.is_set():
-                if not self.collector.ready:
-                    self.abort(self.collector.health.rc, self.collector.health.msg)
-
-                if self.collector.samples_ready:
-                    self.to_stdout()
-                    if self.args.count:
-                        ctr += 1
-                        if ctr > self.args.count:
-                            break
-                event.wait(self.args.delay)
+            print("waiting for samples...", flush=True)
+            with self.profiler.profile_thread():
+                self._batch_loop()
 
         except KeyboardInterrupt:
             logger.info("nvmeof-top stopped by user")
 
+        self.sink.close(timeout=5)
+        if self.sink.broken:
+            # the reader has gone (e.g. piped into head), so silence stdout rather than fail on exit
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        elif self.sink.dropped or self.sink.coalesced:
+            print(f"\noutput fell behind: {self.sink.dropped} intervals dropped, {self.sink.coalesced} coalesced")
+        self.shutdown()
         print("\nnvmeof-top stopped.")
 
+    def _batch_loop(self):
+        ctr = 0
+        version = 0
+        while True:
+            if not self.collector.ready:
+                self.abort(self.collector.health.rc, self.collector.health.msg)
+
+            # output is paced by the collector, so each snapshot is printed exactly once
+            snapshot = self.collector.wait_for_snapshot(version, timeout=1)
+            if self.sink.broken:
+                break
+            if snapshot:
+                version = snapshot.version
+                self.sink.submit(snapshot)
+                if self.args.count:
+                    ctr += 1
+                    if ctr > self.args.count:
+                        break
+
+    def replay_mode(self):
+        logger.info(f"Replaying snapshots from {self.args.replay}")
+        reader = RecordingReader(self.args.replay)
+        if not reader.segments:
+            print(f"No recording found in {self.args.replay}")
+            sys.exit(4)
+
+        ctr = 0
+        try:
+            for record in reader.records(self.args.start, self.args.end):
+                if 'event' in record:
+                    print(format_event(record))
+                    continue
+                self.to_stdout(Snapshot.from_dict(record))
+                ctr += 1
+                if self.args.count and ctr > self.args.count:
+                    break
+        except (KeyboardInterrupt, BrokenPipeError):
+            logger.info("replay stopped by user")
+        if not ctr:
+            print("<no snapshots in the requested time range>")
+
+    def compare_mode(self):
+        before, after = Window(*self.args.before), Window(*self.args.after)
+        source = self.args.replay or self.args.api_url
+        logger.info(f"Comparing windows from {source}")
+        try:
+            if self.args.replay:
+                reader = RecordingReader(self.args.replay)
+                before.load_recording(reader)
+                after.load_recording(reader)
+            else:
+                url = self.args.api_url.rstrip('/')
+                before.load_api(url)
+                after.load_api(url)
+        except (OSError, ValueError, KeyError) as err:
+            print(f"Unable to read history from {source}: {err}")
+            sys.exit(4)
+
+        if not before.values or not after.values:
+            print(f"No samples in the {'before' if not before.values else 'after'} window from {source}")
+            sys.exit(4)
+
+        changes, only_before, only_after, sparse = compare(before, after)
+        print(format_changes(changes, only_before, only_after, sparse, self.args.compare_top), end='')
+
+    def shutdown(self):
+        """Stop the collector and any background stages before the interpreter exits (once)"""
+        if self._shut_down:
+            return
+        self._shut_down = True
+        self.collector.stop()
+        if self.collector_thread:
+            self.collector_thread.join(timeout=5)
+        if self.burst:
+            self.burst.stop()
+        if self.tracer:
+            # a window cut short by the exit ends here, after the previous settings are restored
+            self.tracer.stop()
+            for event in self.tracer.drain_events():
+                print(event)
+        if self.recorder:
+            self.recorder.stop()
+        if self.api:
+            self.api.stop()
+        if self.web:
+            self.web.stop()
+        if self.analytics:
+            self.analytics.shutdown()
+        if self.profiler.enabled:
+            print(f"\n{self.profiler.report()}", end='')
+            self.profiler.dump()
+
     def abort(self, rc: int, msg: str):
         logger.critical(f"collector has hit a problem: {self.collector.health.msg}")
         print(msg)
         sys.exit(rc)
 
     def run(self):
-        self.collector = DataCollector(self.client, self.args.delay, self.args.subsystem)
+        if self.args.before:
+            self.compare_mode()
+            return
+        if self.args.replay:
+            self.replay_mode()
+            return
+
+        if self.args.mode == 'daemon' or self.args.trace_on_spike:
+            signal.signal(signal.SIGTERM, _raise_interrupt)
+        try:
+            self._run_live()
+        finally:
+            # abort() and the start up failures exit from where they are found, so this is the
+            # one place that always runs, e.g. to restore SPDK logging raised by a trace capture
+            self.shutdown()
+
+    def _run_live(self):
+        if self.args.adaptive:
+            pacer = AdaptiveInterval(self.args.delay, self.args.min_delay, self.args.max_delay)
+        else:
+            pacer = FixedInterval(self.args.delay)
+        if self.args.concurrency:
+            concurrency = FixedConcurrency(self.args.concurrency)
+        else:
+            concurrency = ConcurrencyTuner(max_limit=self.args.max_concurrency)
+        selector = NamespaceSelector(nsids=self.args.nsid, pools=self.args.pool, images=self.args.image)
+        if self.args.attach:
+            self.collector = DaemonClient(self.args.socket, self.args.subsystem, selector=selector)
+        else:
+            self.collector = DataCollector(self.client, self.args.delay, self.args.subsystem, profiler=self.profiler,
+                                           pacer=pacer, selector=selector, evict_after=self.args.evict_after,
+                                           max_entries=self.args.max_entries, warmup_interval=self.args.warmup,
+                                           concurrency=concurrency, stagger=self.args.stagger)
         self.collector.initialise()
         if not self.collector.ready:
             self.abort(self.collector.health.rc, self.collector.health.msg)
 
-        t = threading.Thread(target=self.collector.run, daemon=True)
-        t.start()
+        if self.args.record:
+            self.recorder = Recorder(self.args.record, int(self.args.record_segment_size * 1024 * 1024),
+                                     self.args.record_segment_age, int(self.args.record_max_size * 1024 * 1024))
+            try:
+                self.recorder.start()
+            except OSError as err:
+                print(f"Unable to record to {self.args.record}: {err}")
+                sys.exit(4)
+            self.collector.subscribe(self.recorder.record)
+
+        if self.args.mode == "console" or self.args.api_port:
+            self.history = History(self.args.history)
+            self.collector.subscribe(self.history.record)
+
+        if self.args.api_port:
+            self.api = QueryServer(self.history, self.args.api_addr, self.args.api_port)
+            try:
+                self.api.start()
+            except OSError as err:
+                print(f"Unable to serve the query API on {self.args.api_addr}:{self.args.api_port}: {err}")
+                sys.exit(4)
+
+        if self.args.web_port:
+            self.web = Dashboard(self.args.subsystem, self.args.web_addr, self.args.web_port)
+            try:
+                self.web.start()
+            except OSError as err:
+                print(f"Unable to serve the web dashboard on {self.args.web_addr}:{self.args.web_port}: {err}")
+                sys.exit(4)
+            self.collector.subscribe(self.web.observe)
+
+        if self.args.trace_on_spike:
+            self.tracer = TraceCapture(self.client, self.args.trace_window, self.args.trace_cooldown,
+                                       self.args.spike_factor, self.args.spike_min_await, self.args.trace_level)
+            if self.recorder:
+                self.tracer.listeners.append(self.recorder.record_event)
+            self.collector.subscribe(self.tracer.observe)
+
+        if self.args.forecast:
+            self.forecaster = SaturationForecaster(self.args.forecast, self.args.capacity_iops, self.args.capacity_mbps)
+            self.collector.subscribe(self.forecaster.observe)
+
+        if self.args.analytics != 'off':
+            self.analytics = Analytics(self.args.analytics)
+            self.collector.subscribe(self.analytics.submit)
+
+        if self.args.burst_nsid:
+            self.burst = BurstSampler(self.client, self.args.subsystem, self.args.burst_nsid, self.args.burst_interval)
+            self.burst.start()
+
+        self.collector_thread = threading.Thread(target=self.collector.run, daemon=True)
+        self.collector_thread.start()
 
         if self.args.mode == "batch":
             self.batch_mode()
+        elif self.args.mode == "daemon":
+            self.daemon_mode()
         else:
             self.console_mode()
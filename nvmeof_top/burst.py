@@ -0,0 +1,128 @@
+import threading
+import time
+from nvmeof_top import decode
+import nvmeof_top.proto.gateway_pb2 as pb2
+from nvmeof_top.utils import bytes_to_MB
+from typing import Dict, List, NamedTuple, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BurstPeak(NamedTuple):
+    samples: int
+    iops: float
+    bytes_sec: float
+    await_ms: float
+
+
+class _Tracker:
+    """Last raw counters and the running peaks for one namespace, so memory use is fixed"""
+
+    def __init__(self):
+        self.last: Optional[tuple] = None
+        self.peak = BurstPeak(0, 0.0, 0.0, 0.0)
+
+    def update(self, counters: decode.Counters):
+        tick_rate, ticks, read_ops, read_bytes, read_ticks, write_ops, write_bytes, write_ticks = counters
+        if not tick_rate:
+            return
+        ticks = ticks / tick_rate
+        ops = read_ops + write_ops
+        nbytes = read_bytes + write_bytes
+        lat = (read_ticks + write_ticks) / tick_rate
+        current = (ticks, ops, nbytes, lat)
+        last, self.last = self.last, current
+        if last is None:
+            return
+
+        interval = ticks - last[0]
+        delta_ops = ops - last[1]
+        if interval <= 0 or delta_ops < 0:
+            # gateway restart or counter reset; the next sample starts a fresh baseline
+            return
+
+        await_ms = ((lat - last[3]) / delta_ops) * 1000 if delta_ops else 0.0
+        self.peak = BurstPeak(
+            self.peak.samples + 1,
+            max(self.peak.iops, delta_ops / interval),
+            max(self.peak.bytes_sec, (nbytes - last[2]) / interval),
+            max(self.peak.await_ms, await_ms),
+        )
+
+
+class BurstSampler:
+    """High resolution sampling of a few namespaces, to expose bursts the display interval hides
+
+    Runs its own loop in a dedicated thread. Each tick issues the RPCs for all watched
+    namespaces concurrently as grpc futures, so a single thread can sustain ~100ms sampling
+    without competing with the main collector's thread pool. Only running peaks are kept.
+    """
+
+    def __init__(self, client, subsystem: str, nsids: List[int], interval: float):
+        self.subsystem = subsystem
+        self.nsids = nsids
+        self.interval = interval
+        self.trackers: Dict[int, _Tracker] = {nsid: _Tracker() for nsid in nsids}
+        self.lock = threading.Lock()
+        self.overruns = 0
+        self._get_io_stats = client.raw_method('namespace_get_io_stats')
+        self._decode = decode.select_decoder()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self):
+        futures = [
+            (nsid, self._get_io_stats.future(pb2.namespace_get_io_stats_req(subsystem_nqn=self.subsystem, nsid=nsid)))
+            for nsid in self.nsids
+        ]
+        for nsid, future in futures:
+            try:
+                status, _uuid, counters = self._decode(future.result(timeout=self.interval * 10))
+            except Exception as err:
+                logger.debug("burst sample for nsid %s failed: %s", nsid, err)
+                continue
+            if status != 0:
+                logger.debug("burst sample for nsid %s returned status %s", nsid, status)
+                continue
+            with self.lock:
+                self.trackers[nsid].update(counters)
+
+    def _loop(self):
+        logger.info(f"burst sampling nsids {self.nsids} every {self.interval}s")
+        deadline = time.monotonic()
+        while not self._stop.is_set():
+            self._sample()
+            deadline += self.interval
+            delay = deadline - time.monotonic()
+            if delay < 0:
+                # fell behind, so skip the missed ticks rather than firing them back to back
+                self.overruns += 1
+                deadline = time.monotonic()
+                continue
+            self._stop.wait(delay)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name='burst-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def drain_peaks(self) -> Dict[int, BurstPeak]:
+        """Return the peaks seen since the last call, starting a new display interval"""
+        with self.lock:
+            peaks = {nsid: tracker.peak for nsid, tracker in self.trackers.items()}
+            for tracker in self.trackers.values():
+                tracker.peak = BurstPeak(0, 0.0, 0.0, 0.0)
+        return peaks
+
+    def format_peaks(self, peaks: Dict[int, BurstPeak]) -> str:
+        """Render the peak summary for batch mode"""
+        lines = [f"Burst peaks ({int(self.interval * 1000)}ms samples, {self.overruns} overruns):"]
+        for nsid, peak in sorted(peaks.items()):
+            lines.append(f"  nsid {nsid:>4}  max {int(peak.iops)} IOPS  {bytes_to_MB(peak.bytes_sec):3.2f} MB/s  "
+                         f"{peak.await_ms:3.2f} ms await  ({peak.samples} samples)")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,128 @@
+import asyncio
+import selectors
+import threading
+import time
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Optional
+
+
+class SystemClock:
+    """Real time, used by every normal run of the collector"""
+
+    def time(self) -> float:
+        return time.time()
+
+    def monotonic(self) -> float:
+        return time.perf_counter()
+
+    def wait(self, event: threading.Event, secs: float) -> bool:
+        """Block until event is set or secs have passed, returning whether it was set"""
+        return event.wait(secs)
+
+    def executor(self, max_workers: int, thread_name_prefix: str) -> Executor:
+        return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+
+    def new_event_loop(self) -> asyncio.AbstractEventLoop:
+        return asyncio.new_event_loop()
+
+
+class SimulatedClock:
+    """Virtual time that only moves when something waits, so hours of collection run in seconds
+
+    The collector's event loop runs on this clock, and jumps straight to its next timer instead
+    of sleeping. Work handed to executor() runs inline, one job at a time: each job starts at the
+    current virtual time, anything it sleeps (a simulated RPC's latency) adds to that job's own
+    elapsed time, and its future completes that much later in virtual time. Jobs therefore
+    overlap as they would in a thread pool, while every run of a simulation stays identical.
+    """
+
+    def __init__(self, start: float = 1700000000.0):
+        self.start = start
+        self.now = 0.0
+        # virtual secs consumed by the inline job being run, if any
+        self._job: Optional[float] = None
+
+    def time(self) -> float:
+        return self.start + self.monotonic()
+
+    def monotonic(self) -> float:
+        return self.now + (self._job or 0.0)
+
+    def sleep(self, secs: float):
+        """Pass secs of virtual time, within the running job when there is one"""
+        if secs <= 0:
+            return
+        if self._job is not None:
+            self._job += secs
+        else:
+            self.now += secs
+
+    def wait(self, event: threading.Event, secs: float) -> bool:
+        if not event.is_set():
+            self.sleep(secs)
+        return event.is_set()
+
+    def executor(self, max_workers: int, thread_name_prefix: str) -> Executor:
+        return _InlineExecutor(self)
+
+    def new_event_loop(self) -> asyncio.AbstractEventLoop:
+        return _VirtualTimeLoop(self)
+
+
+def _complete(future: Future, outcome: str, value):
+    if not future.cancelled():
+        getattr(future, outcome)(value)
+
+
+class _InlineExecutor(Executor):
+    """Run jobs as soon as they are submitted, completing them after their virtual elapsed time"""
+
+    def __init__(self, clock: SimulatedClock):
+        self.clock = clock
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        future: Future = Future()
+        self.clock._job = 0.0
+        try:
+            outcome, value = 'set_result', fn(*args, **kwargs)
+        except BaseException as err:
+            outcome, value = 'set_exception', err
+        finally:
+            elapsed, self.clock._job = self.clock._job, None
+        # submitted from the event loop, by run_in_executor
+        asyncio.get_running_loop().call_later(elapsed, _complete, future, outcome, value)
+        return future
+
+
+class _VirtualSelector(selectors.DefaultSelector):
+    """Advance the clock by the loop's timeout, rather than waiting for it
+
+    Nothing in a simulation does real IO, so there is never anything ready to report.
+    """
+
+    def __init__(self, clock: SimulatedClock):
+        super().__init__()
+        self.clock = clock
+
+    def select(self, timeout=None):
+        if timeout is None:
+            # nothing is scheduled, and with no threads nothing else can wake the loop
+            raise RuntimeError("simulated event loop has nothing left to wait for")
+        if timeout > 0:
+            self.clock.now += timeout
+        return []
+
+
+class _VirtualTimeLoop(asyncio.SelectorEventLoop):
+
+    def __init__(self, clock: SimulatedClock):
+        self.clock = clock
+        super().__init__(_VirtualSelector(clock))
+
+    def time(self) -> float:
+        return self.clock.monotonic()
+
+    def _write_to_self(self):
+        # everything runs on the loop's own thread, and select() never blocks, so there is no
+        # need to wake it (this is called each time an executor future completes)
+        pass
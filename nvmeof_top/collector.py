@@ -1,11 +1,20 @@
 import asyncio
+import statistics
 import threading
+from collections import OrderedDict
+from concurrent.futures import Executor
+from nvmeof_top import decode
+from nvmeof_top.clock import SystemClock
 import nvmeof_top.proto.gateway_pb2 as pb2
-import time
+from nvmeof_top.pacing import ConcurrencyTuner, FixedInterval
+from nvmeof_top.profiler import Profiler
+from nvmeof_top.selector import NamespaceSelector
+from nvmeof_top.snapshot import IORates, NamespaceRow, Snapshot
+from nvmeof_top.utils import rss_bytes
 import grpc
 import logging
+from typing import Callable, Dict, List, Optional
 
-event = threading.Event()
 logger = logging.getLogger(__name__)
 
 
@@ -29,6 +38,10 @@ class IOStatCounter:
         """Calculate the per second change rate"""
         return (self.current - self.last) / interval
 
+    @property
+    def delta(self) -> float:
+        return self.current - self.last
+
 
 class PerformanceStats:
     def __init__(self, bdev: str):
@@ -39,50 +52,206 @@ class PerformanceStats:
         self.write_ops = IOStatCounter()
         self.write_bytes = IOStatCounter()
         self.write_secs = IOStatCounter()
+        self.sample_time = IOStatCounter()
+        self.uuid: Optional[str] = None
+        self.valid = False
+        self.resets = 0
+        self.last_seen = 0
+
+    @property
+    def counters(self) -> List[IOStatCounter]:
+        return [self.read_ops, self.read_bytes, self.read_secs, self.write_ops, self.write_bytes, self.write_secs]
 
+    def update(self, counters: decode.Counters, uuid: str):
+        """Apply the counters of a decoded namespace_io_stats_info sample
 
-class DataCollector:
+        The interval ending at this sample is only valid when it can produce a meaningful rate. The
+        first sample has no baseline, and a uuid change (namespace deleted and re-added under the
+        same bdev), a tick regression (gateway restart) or any counter going backwards means the
+        baseline no longer relates to the new values. Invalid intervals report no rates, and the
+        new sample becomes the baseline for the next one.
+        """
+        tick_rate, ticks, read_ops, read_bytes, read_ticks, write_ops, write_bytes, write_ticks = counters
+        if not tick_rate:
+            reason = "gateway reported a zero tick rate"
+            sample_time = self.sample_time.current
+            tick_rate = 1
+        else:
+            sample_time = ticks / tick_rate
+            reason = None
+        values = (read_ops, read_bytes, read_ticks / tick_rate, write_ops, write_bytes, write_ticks / tick_rate)
 
-    def __init__(self, client, delay: int, subsystem: str):
+        if reason:
+            pass
+        elif self.uuid is None:
+            reason = "first sample"
+        elif uuid != self.uuid:
+            reason = f"uuid changed from {self.uuid} to {uuid}"
+        elif sample_time <= self.sample_time.current:
+            reason = "tick counter went backwards"
+        elif any(value < counter.current for value, counter in zip(values, self.counters)):
+            reason = "counter decreased"
+
+        self.uuid = uuid
+        self.sample_time.update(sample_time)
+        for counter, value in zip(self.counters, values):
+            counter.update(value)
+
+        self.valid = reason is None
+        if reason and reason != "first sample":
+            self.resets += 1
+            logger.info("counter reset detected for %s (%s), skipping interval", self.bdev, reason)
+
+    @property
+    def interval(self) -> float:
+        """Seconds between the last two samples, as measured by the gateway's tick counter"""
+        return self.sample_time.delta
+
+    def rates(self) -> IORates:
+        """Return the per second rates for all counters over the measured sample interval"""
+        interval = self.interval
+        if not self.valid or interval <= 0:
+            return IORates(0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+        return IORates(
+            self.read_ops.rate(interval),
+            self.read_bytes.rate(interval),
+            self.read_secs.rate(interval),
+            self.write_ops.rate(interval),
+            self.write_bytes.rate(interval),
+            self.write_secs.rate(interval),
+        )
+
+
+class SnapshotSource:
+    """Publish snapshots to readers and subscribers
+
+    Shared by the local DataCollector and the daemon client, so the rest of nvmeof-top doesn't
+    need to know where its snapshots come from.
+    """
+
+    def __init__(self):
+        self.snapshot: Optional[Snapshot] = None
+        self.snapshot_published = threading.Condition()
+        self.subscribers: List[Callable[[Snapshot], None]] = []
+        self.health = Health()
+
+    @property
+    def ready(self) -> bool:
+        return self.health.rc == 0
+
+    def subscribe(self, callback: Callable[[Snapshot], None]):
+        """Register a callback to receive each published snapshot"""
+        self.subscribers.append(callback)
+
+    def _publish(self, snapshot: Snapshot):
+        """Pass a snapshot to the subscribers, then make it visible to readers
+
+        Subscribers run first, so a reader woken for this snapshot sees the forecasts and trace
+        events it produced rather than the previous cycle's. The snapshot reference is swapped in
+        a single assignment, so readers never need a lock and never see a partially updated cycle.
+        """
+        for callback in self.subscribers:
+            try:
+                callback(snapshot)
+            except Exception:
+                logger.exception("snapshot subscriber failed")
+
+        self.snapshot = snapshot
+        with self.snapshot_published:
+            self.snapshot_published.notify_all()
+
+    def wait_for_snapshot(self, after_version: int, timeout: float) -> Optional[Snapshot]:
+        """Wait for a snapshot newer than after_version, returning None on timeout"""
+        with self.snapshot_published:
+            self.snapshot_published.wait_for(
+                lambda: self.snapshot is not None and self.snapshot.version > after_version, timeout)
+        snapshot = self.snapshot
+        if snapshot and snapshot.version > after_version:
+            return snapshot
+        return None
+
+
+class DataCollector(SnapshotSource):
+
+    stagger_fraction = 0.8
+
+    def __init__(self, client, delay: float, subsystem: str, profiler: Optional[Profiler] = None, pacer=None,
+                 selector: Optional[NamespaceSelector] = None, evict_after: int = 10, max_entries: int = 0,
+                 warmup_interval: float = 0.5, concurrency=None, stagger: bool = False, clock=None):
+        super().__init__()
         self.client = client
+        # a SimulatedClock runs the collector in virtual time, see nvmeof_top.sim
+        self.clock = clock or SystemClock()
+        self.stopped = threading.Event()
+        self.selector = selector or NamespaceSelector()
+        self.profiler = profiler or Profiler()
         self.delay = delay
+        self.pacer = pacer or FixedInterval(delay)
+        self.interval = self.pacer.interval
+        self.warmup_interval = warmup_interval
+        self.concurrency = concurrency or ConcurrencyTuner()
+        self.rpc_limit = self.concurrency.limit
+        self._executor: Optional[Executor] = None
+        self.stagger = stagger
+        self._spread = 0.0
         self.subsystem = subsystem
         self.namespaces = None
+        # seeded from the clock, so ids don't repeat when a recording spans restarts
+        self.topology = int(self.clock.time() * 1000000)
+        self._namespace_info = None
         self.subsystems = None
         self.connections = None
-        self.iostats = {}
+        # ordered by the cycle each bdev was last seen, oldest first, so eviction is cheap
+        self.iostats: OrderedDict[str, PerformanceStats] = OrderedDict()
         self.iostats_lock = threading.Lock()
-        self.lock = threading.Lock()
+        self.evict_after = evict_after
+        self.max_entries = max_entries
+        self._cap_warned = False
+        self.evicted = 0
+        self._cycle = 0
         self.gw_info = None
-        self.timestamp = None
         self._min_sample_count = 2
         self._sample_count = 0
-        self.health = Health()
-
-    @property
-    def ready(self) -> bool:
-        return self.health.rc == 0
+        self._rpc_secs = 0.0
+        self._rpc_calls = 0
+        self._decode = decode.select_decoder()
 
     def initialise(self):
         self.set_gw_info()
+        self._get_io_stats_raw = self.client.raw_method('namespace_get_io_stats')
 
     @property
     def samples_ready(self) -> bool:
         return self._sample_count == self._min_sample_count
 
+    def publish(self):
+        """Build a snapshot of the last cycle and publish it
+
+        The snapshot's interval is the one its rates were measured over (the median of the
+        namespaces' sample intervals), not the wait the pacer has chosen for the next cycle.
+        """
+        with self.profiler.stage('rates'), self.iostats_lock:
+            selected = [(ns, self.iostats[ns.bdev_name]) for ns in sorted(self.namespaces, key=lambda ns: ns.nsid)
+                        if ns.bdev_name in self.iostats]
+            rows = tuple(NamespaceRow.from_ns(ns, perf_stats.rates(), perf_stats.valid) for ns, perf_stats in selected)
+            intervals = [perf_stats.interval for _ns, perf_stats in selected if perf_stats.valid and perf_stats.interval > 0]
+        interval = statistics.median(intervals) if intervals else self.interval
+        version = self.snapshot.version + 1 if self.snapshot else 1
+        self._publish(Snapshot(version, self.clock.time(), interval, rows, self.topology))
+
     def call_grpc_api(self, method_name, request):
-        logger.debug(f"calling gprc method {method_name}")
+        logger.debug("calling gprc method %s", method_name)
         try:
             func = getattr(self.client.stub, method_name)
             data = func(request)
-        except grpc._channel._InactiveRpcError:
+        except grpc.RpcError:
             self.health.rc = 8
             self.health.msg = f"RPC endpoint unavailable at {self.client.server}"
-            logger.error(f"gprc call to {method_name} failed: {self.health.msg}")
+            logger.error("gprc call to %s failed: %s", method_name, self.health.msg)
             return None
 
         self.health.msg = f"{method_name} success"
-        logger.debug(f"call to {method_name} successful")
+        logger.debug("call to %s successful", method_name)
         return data
 
     def set_gw_info(self):
@@ -92,36 +261,118 @@ class DataCollector:
     async def collect_data(self):
         if not self._sample_count == self._min_sample_count:
             self._sample_count += 1
+        self._cycle += 1
         namespace_info = self._get_namespaces()
         if not self.ready:
             return
 
         # TODO namespace_info.status should be 0
-        self.namespaces = namespace_info.namespaces
+        if namespace_info != self._namespace_info:
+            self._namespace_info = namespace_info
+            self.topology += 1
+        self.namespaces = self.selector.select(namespace_info.namespaces)
+        over_cap = bool(self.max_entries) and len(self.namespaces) > self.max_entries
+        if over_cap and not self._cap_warned:
+            logger.warning("%d namespaces selected but --max-entries is %d, so the cap only applies to namespaces "
+                           "that have gone", len(self.namespaces), self.max_entries)
+        self._cap_warned = over_cap
         # TODO add log message for len(namespace_info.namespaces)
 
+        # once the first figures are out, staggering spreads the fetches over the share of the
+        # interval chosen as the last cycle ended. Each namespace keeps its slot from cycle to
+        # cycle, and rates come from the per-sample tick counts, so they stay exact.
+        step = self._spread / len(self.namespaces) if self.namespaces else 0.0
+
+        in_flight = asyncio.Semaphore(self.rpc_limit)
         async with asyncio.TaskGroup() as tg:
-            for ns in self.namespaces:
-                tg.create_task(asyncio.to_thread(self._get_ns_iostats, ns))
+            for idx, ns in enumerate(self.namespaces):
+                tg.create_task(self._fetch_ns_iostats(in_flight, ns, idx * step))
 
-            self.subsystems = tg.create_task(asyncio.to_thread(self._get_subsystems))
-            self.connections = tg.create_task(asyncio.to_thread(self._get_connections))
+            self.subsystems = tg.create_task(self._in_executor(self._get_subsystems))
+            self.connections = tg.create_task(self._in_executor(self._get_connections))
+
+        self._evict()
+
+    async def _in_executor(self, func):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func)
+
+    async def _fetch_ns_iostats(self, in_flight: asyncio.Semaphore, ns, delay: float = 0.0):
+        """Run a namespace fetch in the RPC pool, holding one of the cycle's in-flight slots"""
+        if delay:
+            await asyncio.sleep(delay)
+            if self.stopped.is_set():
+                return
+        async with in_flight:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._get_ns_iostats, ns)
 
     def _get_ns_iostats(self, ns):
-        logger.debug(f"fetching iostats for namespace {ns.nsid}")
-        with self.iostats_lock:
+        logger.debug("fetching iostats for namespace %s", ns.nsid)
+        start = self.clock.monotonic()
+        try:
+            data = self._get_io_stats_raw(pb2.namespace_get_io_stats_req(subsystem_nqn=self.subsystem, nsid=ns.nsid))
+        except grpc.RpcError:
+            self.health.rc = 8
+            self.health.msg = f"RPC endpoint unavailable at {self.client.server}"
+            logger.error("gprc call to namespace_get_io_stats failed: %s", self.health.msg)
+            return
+        rpc_secs = self.clock.monotonic() - start
+        self.profiler.record('rpc_wait', rpc_secs)
+        with self.profiler.stage('decode'):
+            status, uuid, counters = self._decode(data)
+
+        with self.profiler.stage('counter_update'), self.iostats_lock:
+            self._rpc_secs += rpc_secs
+            self._rpc_calls += 1
+
+            if status != 0:
+                # the counters of a failed call are zeros, not a sample; keep the baseline for the next one
+                logger.warning("namespace_get_io_stats for nsid %s returned status %s, skipping sample", ns.nsid, status)
+                if ns.bdev_name in self.iostats:
+                    self.iostats[ns.bdev_name].valid = False
+                return
+
             if ns.bdev_name not in self.iostats:
                 self.iostats[ns.bdev_name] = PerformanceStats(ns.bdev_name)
-            stats = self.client.stub.namespace_get_io_stats(pb2.namespace_get_io_stats_req(
-                subsystem_nqn=self.subsystem, nsid=ns.nsid))
 
-            iostats = self.iostats[ns.bdev_name]
-            iostats.read_ops.update(stats.num_read_ops)
-            iostats.read_bytes.update(stats.bytes_read)
-            iostats.read_secs.update((stats.read_latency_ticks / stats.tick_rate))
-            iostats.write_ops.update(stats.num_write_ops)
-            iostats.write_bytes.update(stats.bytes_written)
-            iostats.write_secs.update((stats.write_latency_ticks / stats.tick_rate))
+            perf_stats = self.iostats[ns.bdev_name]
+            perf_stats.update(counters, uuid)
+            perf_stats.last_seen = self._cycle
+            self.iostats.move_to_end(ns.bdev_name)
+
+    def _evict(self):
+        """Drop stats for namespaces that have gone away, and enforce the entry cap
+
+        Entries not seen for evict_after cycles belong to deleted (or deselected) namespaces. When
+        max_entries is set, the least recently seen entries beyond it are dropped too, but never one
+        fetched in the current cycle, or its row would come and go from one interval to the next.
+        """
+        with self.iostats_lock:
+            stale_cycle = self._cycle - self.evict_after
+            evicted = 0
+            while self.iostats:
+                bdev, perf_stats = next(iter(self.iostats.items()))
+                # entries are kept in the order they were last seen, so the rest are current too
+                if perf_stats.last_seen >= self._cycle:
+                    break
+                over_cap = self.max_entries and len(self.iostats) > self.max_entries
+                if perf_stats.last_seen > stale_cycle and not over_cap:
+                    break
+                del self.iostats[bdev]
+                evicted += 1
+
+        if evicted:
+            self.evicted += evicted
+            logger.info(f"evicted {evicted} iostats entries, {len(self.iostats)} remain")
+
+    def diagnostics(self) -> Dict[str, float]:
+        """Report the collector's own footprint and pacing"""
+        return {
+            'entries': len(self.iostats),
+            'evicted': self.evicted,
+            'rss_bytes': rss_bytes(),
+            'interval': self.interval,
+            'concurrency': self.rpc_limit,
+        }
 
     def _get_namespaces(self):
         return self.call_grpc_api('list_namespaces', pb2.list_namespaces_req(subsystem=self.subsystem))
@@ -132,19 +383,74 @@ class DataCollector:
     def _get_connections(self):
         return self.call_grpc_api('list_connections', pb2.list_connections_req(subsystem=self.subsystem))
 
+    def _log_cycle(self, elapsed: float, rpc_latency: Optional[float], published: Optional[Snapshot]):
+        """Log one key=value line per cycle, also attached to the record as cycle_summary"""
+        summary = {
+            'cycle': self._cycle,
+            'namespaces': len(self.namespaces or ()),
+            'elapsed': round(elapsed, 4),
+            'rpc_latency': round(rpc_latency, 5) if rpc_latency is not None else None,
+            'interval': round(self.interval, 3),
+            'concurrency': self.rpc_limit,
+            'entries': len(self.iostats),
+            'dropped': sum(1 for row in published.rows if not row.valid) if published else 0,
+            'evicted': self.evicted,
+        }
+        logger.info("cycle summary %s", ' '.join(f"{key}={value}" for key, value in summary.items()),
+                    extra={'cycle_summary': summary, 'sample': False})
+
+    def _rpc_latency(self) -> Optional[float]:
+        """Mean namespace RPC latency for the last cycle, resetting the accumulators"""
+        with self.iostats_lock:
+            latency = self._rpc_secs / self._rpc_calls if self._rpc_calls else None
+            self._rpc_secs = 0.0
+            self._rpc_calls = 0
+        return latency
+
     async def start(self):
-        while not event.is_set():
-            with self.lock:
-                start = time.time()
-                await self.collect_data()
-                logger.info(f"data collection took: {(time.time() - start):3.3f} secs")
-
-                if not self.ready:
-                    logger.error("Error encounted during data collection, terminating async loop")
-                    return
-                self.timestamp = time.time()
-            event.wait(self.delay)
+        while not self.stopped.is_set():
+            start = self.clock.monotonic()
+            await self.collect_data()
+            elapsed = self.clock.monotonic() - start
+            self.profiler.record('cycle', elapsed)
+
+            if not self.ready:
+                logger.error("Error encounted during data collection, terminating async loop")
+                return
+            rpc_latency = self._rpc_latency()
+            # the tuners judge gateway load, so leave out time deliberately spent staggering
+            busy = max(0.0, elapsed - self._spread)
+            self.interval = self.pacer.observe(busy, rpc_latency)
+            self.rpc_limit = self.concurrency.observe(busy, rpc_latency, len(self.namespaces or ()))
+            if self.samples_ready:
+                self.publish()
+            if logger.isEnabledFor(logging.INFO):
+                self._log_cycle(elapsed, rpc_latency, self.snapshot if self.samples_ready else None)
+            if self.samples_ready and self.stagger:
+                # the next cycle spreads its fetches over most of the new interval, so the wait
+                # leaves room for that spread and for this cycle's fetch time. Publishes then stay
+                # one interval apart even as the interval changes, never beyond max_delay.
+                overrun = elapsed - self._spread
+                self._spread = self.interval * self.stagger_fraction
+                self.clock.wait(self.stopped, max(0.0, self.interval - overrun - self._spread))
+            elif self.samples_ready:
+                self.clock.wait(self.stopped, self.interval)
+            else:
+                # take the second sample after a short warm-up, so the first rates (measured over
+                # this shorter interval) are shown quickly, then settle into the normal cadence
+                self.clock.wait(self.stopped, min(self.warmup_interval, self.interval))
+
+    def stop(self):
+        """Signal the collection loop to finish after the current cycle"""
+        self.stopped.set()
 
     def run(self):
         if self.ready:
-            asyncio.run(self.start())
+            # sized for the largest limit the tuner may pick, plus the subsystem and connection
+            # calls; the semaphore sets the actual limit
+            self._executor = self.clock.executor(self.concurrency.max_limit + 2, 'ns-iostats')
+            try:
+                with self.profiler.profile_thread(), asyncio.Runner(loop_factory=self.clock.new_event_loop) as runner:
+                    runner.run(self.start())
+            finally:
+                self._executor.shutdown(wait=False, cancel_futures=True)
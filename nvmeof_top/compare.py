@@ -0,0 +1,155 @@
+import json
+import math
+import statistics
+from array import array
+from urllib.parse import quote
+from urllib.request import urlopen
+from nvmeof_top.recorder import RecordingReader
+from nvmeof_top.snapshot import IORates
+from nvmeof_top.utils import bytes_to_MB, percentile
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+metric_names = ('IOPS', 'MB/s', 'r_await', 'w_await')
+
+# the sample variance needs two values, and a t statistic from fewer means nothing
+min_samples = 2
+
+
+def metric_values(rates: IORates) -> Tuple[float, float, float, float]:
+    """The figures batch mode shows for a namespace, from the same IORates properties as RowRenderer"""
+    return (rates.total_iops, bytes_to_MB(rates.read_bytes + rates.write_bytes), rates.r_await, rates.w_await)
+
+
+class Window:
+    """Per cycle metric values for each namespace within one time range"""
+
+    def __init__(self, start: float, end: float):
+        self.start = start
+        self.end = end
+        self.values: Dict[str, List[array]] = {}
+        self.labels: Dict[str, Tuple[int, str]] = {}
+
+    def add(self, bdev_name: str, nsid: int, rbd_info: str, values: Tuple[float, ...]):
+        series = self.values.get(bdev_name)
+        if series is None:
+            series = [array('d') for _ in metric_names]
+            self.values[bdev_name] = series
+            self.labels[bdev_name] = (nsid, rbd_info)
+        for metric, value in zip(series, values):
+            metric.append(value)
+
+    def load_recording(self, reader: RecordingReader):
+        for snapshot in reader.snapshots(self.start, self.end):
+            for row in snapshot.rows:
+                if row.valid:
+                    self.add(row.bdev_name, row.nsid, f"{row.rbd_pool_name}/{row.rbd_image_name}", metric_values(row.rates))
+
+    def load_api(self, url: str):
+        """Fill the window from the query API of a running nvmeof-top (--api-port)"""
+        with urlopen(f"{url}/namespaces", timeout=10) as response:
+            namespaces = json.load(response)['namespaces']
+        for ns in namespaces:
+            query = f"{url}/history/namespace/{quote(str(ns['nsid']))}?start={self.start}&end={self.end}"
+            with urlopen(query, timeout=10) as response:
+                points = json.load(response)['points']
+            for point in points:
+                if point['samples']:
+                    self.add(ns['bdev_name'], ns['nsid'], f"{ns['rbd_pool_name']}/{ns['rbd_image_name']}",
+                             (point['iops'], point['read_mbps'] + point['write_mbps'], point['r_await'], point['w_await']))
+
+
+class Summary(NamedTuple):
+    samples: int
+    mean: float
+    variance: float
+    p95: float
+
+
+def summarise(values: array) -> Summary:
+    return Summary(len(values), statistics.fmean(values), statistics.variance(values), percentile(sorted(values), 95))
+
+
+class Change(NamedTuple):
+    nsid: int
+    rbd_info: str
+    metric: str
+    before: Summary
+    after: Summary
+    score: Optional[float]
+
+    @property
+    def pct(self) -> float:
+        if not self.before.mean:
+            return math.inf if self.after.mean else 0.0
+        return (self.after.mean - self.before.mean) / self.before.mean * 100
+
+
+def significance(before: Summary, after: Summary) -> Optional[float]:
+    """Welch's t statistic, so a shift is ranked against the noise in both windows
+
+    Returns None when neither window varies at all, since there is no noise to rank against.
+    """
+    spread = math.sqrt(before.variance / before.samples + after.variance / after.samples)
+    if not spread:
+        return None
+    return abs(after.mean - before.mean) / spread
+
+
+def compare(before: Window, after: Window) -> Tuple[List[Change], List[str], List[str], List[str]]:
+    """Rank every namespace/metric change by significance
+
+    Returns the changes, most significant first, then the labels of namespaces only sampled in
+    the before or after window, and of those with fewer than min_samples cycles in either window.
+    Metrics that are constant in both windows have no score and are ranked last, or dropped
+    when the constant did not change.
+    """
+    def label(window, bdev_name):
+        return "{} {}".format(*window.labels[bdev_name])
+
+    changes, sparse = [], []
+    for bdev_name, series in before.values.items():
+        if bdev_name not in after.values:
+            continue
+        if min(len(series[0]), len(after.values[bdev_name][0])) < min_samples:
+            sparse.append(label(before, bdev_name))
+            continue
+        nsid, rbd_info = before.labels[bdev_name]
+        for metric, old, new in zip(metric_names, series, after.values[bdev_name]):
+            old_summary, new_summary = summarise(old), summarise(new)
+            score = significance(old_summary, new_summary)
+            if score is None and old_summary.mean == new_summary.mean:
+                continue
+            changes.append(Change(nsid, rbd_info, metric, old_summary, new_summary, score))
+    changes.sort(key=lambda change: -1.0 if change.score is None else change.score, reverse=True)
+
+    only_before = [label(before, name) for name in before.values if name not in after.values]
+    only_after = [label(after, name) for name in after.values if name not in before.values]
+    return changes, only_before, only_after, sparse
+
+
+text_headers = ['NSID', 'RBD pool/image', 'metric', 'before', 'after', 'change', 'p95 before', 'p95 after', 'score']
+text_template = "{:>4}  {:<32}  {:<7}  {:>9}  {:>9}  {:>8}  {:>10}  {:>9}  {:>6}\n"
+
+
+def format_changes(changes: List[Change], only_before: List[str], only_after: List[str], sparse: List[str],
+                   top: int) -> str:
+    lines = [text_template.format(*text_headers)]
+    for change in changes[:top]:
+        lines.append(text_template.format(
+            change.nsid, change.rbd_info, change.metric,
+            f"{change.before.mean:3.2f}", f"{change.after.mean:3.2f}",
+            f"{change.pct:+3.1f}%" if math.isfinite(change.pct) else 'new',
+            f"{change.before.p95:3.2f}", f"{change.after.p95:3.2f}",
+            '-' if change.score is None else f"{change.score:3.1f}"))
+    if len(changes) > top:
+        lines.append(f"... {len(changes) - top} smaller changes not shown\n")
+    if only_before:
+        lines.append(f"only in the before window: {', '.join(only_before)}\n")
+    if only_after:
+        lines.append(f"only in the after window: {', '.join(only_after)}\n")
+    if sparse:
+        lines.append(f"fewer than {min_samples} samples in a window: {', '.join(sparse)}\n")
+    return ''.join(lines)
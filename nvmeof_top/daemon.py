@@ -0,0 +1,215 @@
+import json
+import os
+import queue
+import socket
+import stat
+import threading
+from nvmeof_top.collector import SnapshotSource
+from nvmeof_top.selector import NamespaceSelector
+from nvmeof_top.snapshot import Snapshot
+from typing import Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+protocol_version = 1
+
+
+def _encode(message: dict) -> bytes:
+    return json.dumps(message, separators=(',', ':')).encode() + b'\n'
+
+
+class _ClientWriter:
+    """Feed one attached client from its own thread, so a slow reader can't stall the collector
+
+    Only the most recent payloads are queued. If the client falls behind, the oldest pending
+    payload is dropped in favour of the newest.
+    """
+
+    def __init__(self, conn: socket.socket, on_close):
+        self.conn = conn
+        self.on_close = on_close
+        self.pending: queue.Queue = queue.Queue(maxsize=2)
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name='daemon-client', daemon=True)
+        self._thread.start()
+
+    def send(self, payload: bytes):
+        while True:
+            try:
+                self.pending.put_nowait(payload)
+                return
+            except queue.Full:
+                try:
+                    self.pending.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def close(self):
+        self.send(b'')
+
+    def _run(self):
+        try:
+            while True:
+                payload = self.pending.get()
+                if not payload:
+                    break
+                self.conn.sendall(payload)
+        except OSError as err:
+            logger.info(f"daemon client disconnected: {err}")
+        finally:
+            self.conn.close()
+            self.on_close(self)
+
+
+class SnapshotServer:
+    """Serve the collector's snapshots to attached nvmeof-top clients over a Unix socket
+
+    Each snapshot is serialised once and the same bytes are queued for every client. A newly
+    attached client receives the latest snapshot immediately, so it has data to show without
+    waiting for a collection cycle.
+    """
+
+    def __init__(self, collector, path: str, subsystem: str):
+        self.collector = collector
+        self.path = path
+        self.subsystem = subsystem
+        self.clients: List[_ClientWriter] = []
+        self.clients_lock = threading.Lock()
+        self.latest: Optional[bytes] = None
+        self._sock: Optional[socket.socket] = None
+
+    def start(self):
+        if os.path.exists(self.path):
+            if not stat.S_ISSOCK(os.stat(self.path).st_mode):
+                raise RuntimeError(f"{self.path} exists and is not a socket")
+            # only a stale socket, left by a daemon that didn't exit cleanly, may be replaced
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except OSError:
+                os.unlink(self.path)
+            else:
+                raise RuntimeError(f"daemon already running on {self.path}")
+            finally:
+                probe.close()
+
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self.path)
+        self._sock.listen()
+        self.collector.subscribe(self.broadcast)
+        threading.Thread(target=self._accept, name='daemon-accept', daemon=True).start()
+        logger.info(f"serving snapshots for {self.subsystem} on {self.path}")
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _addr = self._sock.accept()
+            except OSError:
+                return
+            writer = _ClientWriter(conn, self._remove)
+            writer.send(_encode({'type': 'hello', 'protocol': protocol_version, 'subsystem': self.subsystem}))
+            with self.clients_lock:
+                if self.latest:
+                    writer.send(self.latest)
+                self.clients.append(writer)
+            logger.info(f"client attached, {len(self.clients)} connected")
+
+    def _remove(self, writer: _ClientWriter):
+        with self.clients_lock:
+            if writer in self.clients:
+                self.clients.remove(writer)
+
+    def broadcast(self, snapshot: Snapshot):
+        payload = _encode({
+            'type': 'snapshot',
+            'snapshot': snapshot.to_dict(),
+            'diagnostics': dict(self.collector.diagnostics(), clients=len(self.clients)),
+        })
+        with self.clients_lock:
+            self.latest = payload
+            for writer in self.clients:
+                writer.send(payload)
+
+    def stop(self):
+        if self._sock:
+            self._sock.close()
+            self._sock = None
+        with self.clients_lock:
+            for writer in self.clients:
+                writer.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+class DaemonClient(SnapshotSource):
+    """Receive snapshots from an nvmeof-top daemon instead of polling the gateway
+
+    Stands in for DataCollector, so batch mode, analytics and the other consumers work unchanged.
+    Namespace selectors are applied to the received rows.
+    """
+
+    def __init__(self, path: str, subsystem: str, selector: Optional[NamespaceSelector] = None):
+        super().__init__()
+        self.path = path
+        self.subsystem = subsystem
+        self.selector = selector or NamespaceSelector()
+        self.server_diagnostics: Dict[str, float] = {}
+        self._sock: Optional[socket.socket] = None
+        self._reader = None
+
+    def initialise(self):
+        try:
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.settimeout(5)
+            self._sock.connect(self.path)
+            self._reader = self._sock.makefile('rb')
+            hello = json.loads(self._reader.readline() or b'{}')
+            self._sock.settimeout(None)
+        except (OSError, ValueError) as err:
+            self.health.rc = 8
+            self.health.msg = f"Unable to attach to nvmeof-top daemon at {self.path}: {err}"
+            return
+
+        if hello.get('type') != 'hello' or hello.get('protocol') != protocol_version:
+            self.health.rc = 8
+            self.health.msg = f"Unexpected handshake from nvmeof-top daemon at {self.path}"
+        elif hello.get('subsystem') != self.subsystem:
+            self.health.rc = 8
+            self.health.msg = f"nvmeof-top daemon at {self.path} is monitoring {hello.get('subsystem')}, not {self.subsystem}"
+
+    def run(self):
+        if not self.ready:
+            return
+        try:
+            for line in self._reader:
+                message = json.loads(line)
+                if message.get('type') != 'snapshot':
+                    continue
+                self.server_diagnostics = message.get('diagnostics', {})
+                snapshot = Snapshot.from_dict(message['snapshot'])
+                if self.selector.active:
+                    rows = tuple(row for row in snapshot.rows if self.selector.matches(row))
+                    snapshot = Snapshot(snapshot.version, snapshot.timestamp, snapshot.interval, rows, snapshot.topology)
+                self._publish(snapshot)
+        except (OSError, ValueError) as err:
+            logger.error(f"lost connection to nvmeof-top daemon: {err}")
+
+        if self._sock:
+            self.health.rc = 8
+            self.health.msg = f"nvmeof-top daemon at {self.path} closed the connection"
+
+    def stop(self):
+        sock, self._sock = self._sock, None
+        if sock:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+
+    def diagnostics(self) -> Dict[str, float]:
+        return self.server_diagnostics
@@ -0,0 +1,131 @@
+import threading
+from array import array
+from operator import itemgetter
+from google.protobuf.internal import api_implementation
+import nvmeof_top.proto.gateway_pb2 as pb2
+from typing import Callable, Tuple
+
+# namespace_io_stats_info field numbers (see proto/gateway.proto)
+TICK_RATE = 7
+TICKS = 8
+BYTES_READ = 9
+NUM_READ_OPS = 10
+BYTES_WRITTEN = 11
+NUM_WRITE_OPS = 12
+READ_LATENCY_TICKS = 15
+WRITE_LATENCY_TICKS = 18
+UUID = 5
+
+row_size = 28  # indexed by field number, so the row covers fields 1..27
+_zero_row = array('Q', bytes(8 * row_size))
+
+# the counters every decoder returns, in this order:
+# (tick_rate, ticks, num_read_ops, bytes_read, read_latency_ticks,
+#  num_write_ops, bytes_written, write_latency_ticks)
+Counters = Tuple[int, int, int, int, int, int, int, int]
+_row_counters = itemgetter(TICK_RATE, TICKS, NUM_READ_OPS, BYTES_READ, READ_LATENCY_TICKS,
+                           NUM_WRITE_OPS, BYTES_WRITTEN, WRITE_LATENCY_TICKS)
+_rows = threading.local()
+
+
+def new_row() -> array:
+    """Allocate a row to decode into; rows are reused across samples"""
+    return array('Q', _zero_row)
+
+
+def decode_io_stats_wire(data: bytes, row: array) -> Tuple[int, str]:
+    """Decode a serialised namespace_io_stats_info straight into a preallocated row
+
+    Every varint field lands in row[field_number], so no message object or per-field Python
+    attribute lookups are involved. Returns (status, uuid) since those aren't numeric counters.
+    Unknown and repeated fields are skipped. Fields absent from the message (proto3 defaults) are
+    zeroed, so a row can be safely reused.
+    """
+    row[:] = _zero_row
+    uuid = b''
+    pos = 0
+    end = len(data)
+    while pos < end:
+        # fields below 16 have a single byte tag, the rest take the slower path below
+        tag = data[pos]
+        pos += 1
+        if tag & 0x80:
+            shift = 7
+            tag &= 0x7f
+            while True:
+                byte = data[pos]
+                pos += 1
+                tag |= (byte & 0x7f) << shift
+                if not byte & 0x80:
+                    break
+                shift += 7
+        field = tag >> 3
+        wire_type = tag & 7
+
+        if wire_type == 0:
+            byte = data[pos]
+            pos += 1
+            value = byte & 0x7f
+            shift = 7
+            while byte & 0x80:
+                byte = data[pos]
+                pos += 1
+                value |= (byte & 0x7f) << shift
+                shift += 7
+            if field < row_size:
+                # int32 status is sign extended to 64 bits on the wire
+                row[field] = value & 0xffffffffffffffff
+        elif wire_type == 2:
+            byte = data[pos]
+            pos += 1
+            length = byte & 0x7f
+            shift = 7
+            while byte & 0x80:
+                byte = data[pos]
+                pos += 1
+                length |= (byte & 0x7f) << shift
+                shift += 7
+            if field == UUID:
+                uuid = data[pos:pos + length]
+            pos += length
+        elif wire_type == 1:
+            pos += 8
+        elif wire_type == 5:
+            pos += 4
+        else:
+            raise ValueError(f"unsupported wire type {wire_type} for field {field}")
+
+    status = row[1]
+    if status >= 1 << 63:
+        status -= 1 << 64
+    return status, uuid.decode()
+
+
+def decode_counters_wire(data: bytes) -> Tuple[int, str, Counters]:
+    """Wire decode into this thread's preallocated row, then pick out the counters"""
+    row = getattr(_rows, 'row', None)
+    if row is None:
+        row = _rows.row = new_row()
+    status, uuid = decode_io_stats_wire(data, row)
+    return status, uuid, _row_counters(row)
+
+
+def decode_counters_message(data: bytes) -> Tuple[int, str, Counters]:
+    """Decode with the protobuf runtime, reading the counters straight off the message"""
+    stats = pb2.namespace_io_stats_info.FromString(data)
+    return stats.status, stats.uuid, (stats.tick_rate, stats.ticks, stats.num_read_ops, stats.bytes_read,
+                                      stats.read_latency_ticks, stats.num_write_ops, stats.bytes_written,
+                                      stats.write_latency_ticks)
+
+
+def select_decoder() -> Callable[[bytes], Tuple[int, str, Counters]]:
+    """Pick the fastest decoder for the installed protobuf backend
+
+    The C based backends (upb/cpp) parse several times faster than any pure Python wire decoder,
+    so the hand written decoder only wins when protobuf is running its pure Python
+    implementation. On those backends the counters are read off the message as a tuple, since
+    copying them into a row costs more than it saves. See benchmarks/bench_decode.py.
+    """
+    if api_implementation.Type() == 'python':
+        return decode_counters_wire
+    return decode_counters_message
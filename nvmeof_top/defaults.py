@@ -1,7 +1,37 @@
 import os
 
 delay = 3
+warmup_interval = 0.5
+min_delay = 0.5
+max_delay = 30
+burst_interval = 0.1
+evict_after = 10
+max_entries = 0
+concurrency = 'auto'
+max_concurrency = 64
 mode = 'batch'
 server_addr = os.environ.get('SERVER_ADDR', '')
 server_port = os.environ.get('SERVER_PORT', 5500)
 log_level = 'info'
+change_threshold = 10
+heartbeat = 10
+socket = '/tmp/nvmeof-top.sock'
+analytics = 'off'
+record_segment_size = 64
+record_segment_age = 3600
+record_max_size = 1024
+history = 300
+console_metric = 'iops'
+api_addr = '127.0.0.1'
+web_addr = '127.0.0.1'
+compare_top = 25
+log_file = 'nvmeof-top.log'
+log_max_bytes = 10 * 1024 * 1024
+log_backups = 3
+output_queue = 8
+output_policy = 'drop-oldest'
+trace_window = 10
+trace_cooldown = 300
+spike_factor = 4
+spike_min_await = 5
+trace_level = 'debug'
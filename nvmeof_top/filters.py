@@ -0,0 +1,54 @@
+from nvmeof_top.snapshot import NamespaceRow, Snapshot
+from typing import Dict, List, Tuple
+
+
+def _metrics(row: NamespaceRow) -> Tuple[float, float, float, float]:
+    rates = row.rates
+    return (rates.total_iops, rates.read_bytes + rates.write_bytes, rates.r_await, rates.w_await)
+
+
+class RowFilter:
+    """Decide which namespace rows are worth emitting in batch mode
+
+    active_only keeps namespaces with any IO in the interval. changes_only keeps namespaces where
+    IOPS, throughput or await moved by more than threshold (a fraction) since the row was last
+    emitted, so a steady namespace is printed once and then only when it changes.
+    """
+
+    def __init__(self, active_only: bool = False, changes_only: bool = False, threshold: float = 0.1):
+        self.active_only = active_only
+        self.changes_only = changes_only
+        self.threshold = threshold
+        self._emitted: Dict[str, Tuple[float, float, float, float]] = {}
+
+    @property
+    def active(self) -> bool:
+        return self.active_only or self.changes_only
+
+    def _changed(self, row: NamespaceRow) -> bool:
+        metrics = _metrics(row)
+        previous = self._emitted.get(row.bdev_name)
+        if previous is not None and all(
+                abs(new - old) <= self.threshold * abs(old) for new, old in zip(metrics, previous)):
+            return False
+        self._emitted[row.bdev_name] = metrics
+        return True
+
+    def select(self, snapshot: Snapshot) -> List[NamespaceRow]:
+        """Return the rows to emit for this snapshot"""
+        if not self.active:
+            return list(snapshot.rows)
+
+        rows = []
+        for row in snapshot.rows:
+            if self.active_only and row.valid and not row.rates.total_iops:
+                continue
+            if self.changes_only and row.valid and not self._changed(row):
+                continue
+            rows.append(row)
+
+        if self.changes_only and len(self._emitted) > len(snapshot.rows):
+            # forget namespaces that have gone away
+            current = {row.bdev_name for row in snapshot.rows}
+            self._emitted = {bdev: metrics for bdev, metrics in self._emitted.items() if bdev in current}
+        return rows
@@ -0,0 +1,166 @@
+import math
+from array import array
+from nvmeof_top.snapshot import Snapshot
+from nvmeof_top.utils import bytes_to_MB, lb_group
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+metric_names = ('IOPS', 'MB/s', 'rMB/s', 'wMB/s')
+
+
+class TrendSet:
+    """Holt linear trend (level and per second slope) for many series at once
+
+    State lives in parallel arrays indexed by series, so a cycle is one pass over flat arrays
+    with O(1) state per series, whatever the history length. Samples are irregular, so the
+    slope is per second and the level is projected forward by each cycle's interval.
+    """
+
+    def __init__(self, alpha: float = 0.3, beta: float = 0.1):
+        self.alpha = alpha
+        self.beta = beta
+        self.keys: List[str] = []
+        self.level = array('d')
+        self.trend = array('d')
+        self.samples = array('L')
+
+    def _reindex(self, keys: List[str]):
+        """Carry state over to a new set of series, after namespaces come or go"""
+        previous = {key: idx for idx, key in enumerate(self.keys)}
+        level, trend, samples = array('d'), array('d'), array('L')
+        for key in keys:
+            idx = previous.get(key)
+            level.append(self.level[idx] if idx is not None else 0.0)
+            trend.append(self.trend[idx] if idx is not None else 0.0)
+            samples.append(self.samples[idx] if idx is not None else 0)
+        self.keys, self.level, self.trend, self.samples = keys, level, trend, samples
+
+    def update(self, keys: List[str], values: array, dt: float):
+        """Fold in one cycle; values[i] belongs to keys[i], NaN where there was no sample"""
+        if keys != self.keys:
+            self._reindex(keys)
+        if dt <= 0:
+            return
+        alpha, beta = self.alpha, self.beta
+        level, trend, samples = self.level, self.trend, self.samples
+        for idx, value in enumerate(values):
+            if value != value:  # NaN
+                continue
+            if samples[idx]:
+                previous = level[idx]
+                level[idx] = alpha * value + (1 - alpha) * (previous + trend[idx] * dt)
+                trend[idx] = beta * (level[idx] - previous) / dt + (1 - beta) * trend[idx]
+            else:
+                level[idx] = value
+            samples[idx] += 1
+
+
+class Forecast(NamedTuple):
+    scope: str
+    name: str
+    metric: str
+    level: float
+    trend: float
+    limit: float
+    eta: float  # seconds until the limit is reached, 0 when already there
+
+
+def time_to_limit(level: float, trend: float, limit: float) -> float:
+    if level >= limit:
+        return 0.0
+    if trend <= 0:
+        return math.inf
+    return (limit - level) / trend
+
+
+class SaturationForecaster:
+    """Forecast which namespaces, pools and LB groups will hit a limit within the horizon
+
+    Namespaces are checked against their own QoS limits (rw_ios_per_second, rw_mbytes_per_second,
+    r_mbytes_per_second and w_mbytes_per_second). Pool, LB group and subsystem totals are checked
+    against the gateway IOPS and MB/s capacity given by the user, if any. A series needs
+    min_samples cycles before it is forecast.
+    """
+
+    min_samples = 5
+
+    def __init__(self, horizon: float, capacity_iops: Optional[float] = None, capacity_mbps: Optional[float] = None):
+        self.horizon = horizon
+        # there is no separate read or write gateway capacity
+        self.capacity = (capacity_iops, capacity_mbps, None, None)
+        self.namespaces = tuple(TrendSet() for _ in metric_names)
+        self.groups = tuple(TrendSet() for _ in metric_names)
+        self.forecasts: Tuple[Forecast, ...] = ()
+
+    def observe(self, snapshot: Snapshot):
+        """Snapshot subscriber: update every trend, then refresh the forecasts"""
+        keys, labels, limits = [], [], []
+        values = tuple(array('d') for _ in metric_names)
+        totals: Dict[Tuple[str, str], List[float]] = {}
+        for row in snapshot.rows:
+            keys.append(row.bdev_name)
+            labels.append(f"{row.nsid} {row.rbd_pool_name}/{row.rbd_image_name}")
+            limits.append((row.rw_ios_per_second, row.rw_mbytes_per_second, row.r_mbytes_per_second, row.w_mbytes_per_second))
+            if not row.valid:
+                for series in values:
+                    series.append(math.nan)
+                continue
+            read_mbps, write_mbps = bytes_to_MB(row.rates.read_bytes), bytes_to_MB(row.rates.write_bytes)
+            sample = (row.rates.total_iops, read_mbps + write_mbps, read_mbps, write_mbps)
+            for series, value in zip(values, sample):
+                series.append(value)
+            for group in (('pool', row.rbd_pool_name), ('lbgroup', lb_group(row.load_balancing_group)), ('subsystem', 'total')):
+                total = totals.setdefault(group, [0.0] * len(metric_names))
+                for metric, value in enumerate(sample):
+                    total[metric] += value
+
+        group_keys = sorted(totals)
+        group_names = [f"{scope}:{name}" for scope, name in group_keys]
+        for metric in range(len(metric_names)):
+            self.namespaces[metric].update(keys, values[metric], snapshot.interval)
+            if self.capacity[metric]:
+                self.groups[metric].update(group_names, array('d', (totals[key][metric] for key in group_keys)),
+                                           snapshot.interval)
+
+        forecasts = []
+        for metric, name in enumerate(metric_names):
+            trends = self.namespaces[metric]
+            for idx, label in enumerate(labels):
+                if limits[idx][metric]:
+                    forecasts.extend(self._check(trends, idx, 'namespace', label, name, limits[idx][metric]))
+            if self.capacity[metric]:
+                trends = self.groups[metric]
+                for idx, (scope, group) in enumerate(group_keys):
+                    forecasts.extend(self._check(trends, idx, scope, group, name, self.capacity[metric]))
+        forecasts.sort(key=lambda forecast: forecast.eta)
+        self.forecasts = tuple(forecasts)
+
+    def _check(self, trends: TrendSet, idx: int, scope: str, name: str, metric: str, limit: float) -> List[Forecast]:
+        if trends.samples[idx] < self.min_samples:
+            return []
+        eta = time_to_limit(trends.level[idx], trends.trend[idx], limit)
+        if eta > self.horizon:
+            return []
+        return [Forecast(scope, name, metric, trends.level[idx], trends.trend[idx], limit, eta)]
+
+
+def _duration(secs: float) -> str:
+    if secs < 120:
+        return f"{secs:.0f}s"
+    if secs < 7200:
+        return f"{secs / 60:.0f}m"
+    return f"{secs / 3600:.1f}h"
+
+
+def format_forecasts(forecaster: SaturationForecaster) -> str:
+    """Render the current forecasts for batch mode"""
+    if not forecaster.forecasts:
+        return f"saturation forecast: nothing reaches its limit within {_duration(forecaster.horizon)}\n"
+    lines = [f"saturation forecast (horizon {_duration(forecaster.horizon)}):\n"]
+    for forecast in forecaster.forecasts:
+        when = 'at limit now' if not forecast.eta else f"limit in {_duration(forecast.eta)}"
+        lines.append(f"  {forecast.scope:<9} {forecast.name:<36} {forecast.metric:<5} {forecast.level:10.1f} "
+                     f"({forecast.trend * 60:+.1f}/min)  limit {forecast.limit:g}, {when}\n")
+    return ''.join(lines)
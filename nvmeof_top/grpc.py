@@ -8,6 +8,7 @@ class GatewayClient:
         self.server_addr = server_addr
         self.server_port = server_port
         self._stub = None
+        self._channel = None
 
     @property
     def server(self):
@@ -26,5 +27,18 @@ class GatewayClient:
         a grpc._channel._InactiveRpcError will be thrown and will need to be caught. Hint a normal try/except didn't catch it!
         """
 
-        channel = grpc.insecure_channel(self.server)
-        self._stub = pb2_grpc.GatewayStub(channel)
+        self._channel = grpc.insecure_channel(self.server)
+        self._stub = pb2_grpc.GatewayStub(self._channel)
+
+    def raw_method(self, method_name: str):
+        """Return a callable for a Gateway RPC that skips response decoding
+
+        The callable returns the serialized response bytes, so callers can time or optimise
+        decoding separately from the RPC itself.
+        """
+        if not self._channel:
+            raise AttributeError("client channel not initialised. Use the connect() method first")
+        return self._channel.unary_unary(
+            f'/Gateway/{method_name}',
+            request_serializer=lambda request: request.SerializeToString(),
+        )
@@ -0,0 +1,166 @@
+import bisect
+import curses
+from collections import deque
+from nvmeof_top.history import History
+from nvmeof_top.snapshot import IORates, NamespaceRow, Snapshot
+from nvmeof_top.utils import bytes_to_MB
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# value extractor and level thresholds for each metric. Thresholds are fixed (roughly log scale),
+# so a cell's level never changes once drawn and a new cycle only adds one column
+metrics: Dict[str, Tuple[Callable[[IORates], float], Tuple[float, ...]]] = {
+    'iops': (lambda rates: rates.total_iops, (1, 10, 100, 1000, 10000, 100000)),
+    'mbps': (lambda rates: bytes_to_MB(rates.read_bytes + rates.write_bytes), (0.01, 0.1, 1, 10, 100, 1000)),
+    'await': (lambda rates: rates.total_await, (0.1, 0.5, 1, 5, 20, 100)),
+}
+
+NOT_SAMPLED = -1
+shades = ' .:+*#@'
+colours = [curses.COLOR_BLACK, curses.COLOR_BLUE, curses.COLOR_CYAN, curses.COLOR_GREEN,
+           curses.COLOR_YELLOW, curses.COLOR_MAGENTA, curses.COLOR_RED]
+label_width = 30
+
+
+def level(metric: str, rates: Optional[IORates]) -> int:
+    if rates is None:
+        return NOT_SAMPLED
+    extract, thresholds = metrics[metric]
+    return bisect.bisect_right(thresholds, extract(rates))
+
+
+class Heatmap:
+    """Namespace x time grid of metric levels
+
+    Each namespace keeps a deque of its last `columns` levels. A cycle appends one level per
+    namespace and the oldest falls off the left, so the grid is never recomputed. Switching
+    metric or resizing rebuilds it once from the shared History.
+    """
+
+    def __init__(self, columns: int, metric: str = 'iops'):
+        self.columns = columns
+        self.metric = metric
+        self.cells: Dict[str, Deque[int]] = {}
+        self.rows: Dict[str, NamespaceRow] = {}
+        self.timestamps: Deque[float] = deque(maxlen=columns)
+
+    def push(self, snapshot: Snapshot):
+        """Add the snapshot as the rightmost column"""
+        self.timestamps.append(snapshot.timestamp)
+        seen = set()
+        for row in snapshot.rows:
+            cells = self.cells.get(row.bdev_name)
+            if cells is None:
+                cells = deque([NOT_SAMPLED] * (len(self.timestamps) - 1), maxlen=self.columns)
+                self.cells[row.bdev_name] = cells
+            cells.append(level(self.metric, row.rates if row.valid else None))
+            self.rows[row.bdev_name] = row
+            seen.add(row.bdev_name)
+
+        for bdev_name in [name for name in self.cells if name not in seen]:
+            cells = self.cells[bdev_name]
+            cells.append(NOT_SAMPLED)
+            if cells.count(NOT_SAMPLED) == len(cells):
+                # scrolled out of the window entirely
+                del self.cells[bdev_name]
+                del self.rows[bdev_name]
+
+    def rebuild(self, history: History, columns: int, metric: str):
+        """Regenerate the grid from history, after a metric change or terminal resize"""
+        self.columns = columns
+        self.metric = metric
+        self.cells = {}
+        self.timestamps = deque(maxlen=columns)
+        with history.lock:
+            rows = dict(history.rows)
+        for bdev_name, row in rows.items():
+            timestamps, window = history.window(bdev_name)
+            self.cells[bdev_name] = deque((level(metric, rates) for rates in window), maxlen=columns)
+            self.timestamps = deque(timestamps, maxlen=columns)
+        self.rows = rows
+
+    def ordered(self) -> List[str]:
+        return sorted(self.cells, key=lambda bdev_name: self.rows[bdev_name].nsid)
+
+
+class HeatmapScreen:
+    """Draw a Heatmap with curses; q quits, m cycles the metric, arrows and page keys scroll"""
+
+    def __init__(self, stdscr, history: History, metric: str):
+        self.stdscr = stdscr
+        self.history = history
+        self.top = 0
+        self.colour = curses.has_colors()
+        if self.colour:
+            curses.start_color()
+            for idx, colour in enumerate(colours[1:], start=1):
+                curses.init_pair(idx, colour, curses.COLOR_BLACK)
+        curses.curs_set(0)
+        self.heatmap = Heatmap(self._columns(), metric)
+
+    def _columns(self) -> int:
+        _height, width = self.stdscr.getmaxyx()
+        return max(1, min(self.history.depth, width - label_width - 1))
+
+    def handle_key(self, key: int) -> bool:
+        """Act on a key press, returning False when the user asks to quit"""
+        height = self.stdscr.getmaxyx()[0] - 3
+        if key in (ord('q'), ord('Q')):
+            return False
+        if key in (ord('m'), ord('M')):
+            names = list(metrics)
+            metric = names[(names.index(self.heatmap.metric) + 1) % len(names)]
+            self.heatmap.rebuild(self.history, self.heatmap.columns, metric)
+        elif key == curses.KEY_RESIZE:
+            self.heatmap.rebuild(self.history, self._columns(), self.heatmap.metric)
+        elif key == curses.KEY_DOWN:
+            self.top += 1
+        elif key == curses.KEY_UP:
+            self.top -= 1
+        elif key == curses.KEY_NPAGE:
+            self.top += height
+        elif key == curses.KEY_PPAGE:
+            self.top -= height
+        self.top = max(0, min(self.top, len(self.heatmap.cells) - height))
+        return True
+
+    def _draw_cells(self, y: int, cells: Deque[int]):
+        x = label_width + 1 + self.heatmap.columns - len(cells)
+        # draw runs of the same level together to keep the number of curses calls down
+        run_level, run_length = None, 0
+        for cell in list(cells) + [None]:
+            if cell == run_level:
+                run_length += 1
+                continue
+            if run_length:
+                if run_level == NOT_SAMPLED:
+                    self.stdscr.addstr(y, x, ' ' * run_length)
+                elif self.colour and run_level:
+                    self.stdscr.addstr(y, x, '█' * run_length, curses.color_pair(run_level))
+                else:
+                    self.stdscr.addstr(y, x, shades[run_level] * run_length)
+                x += run_length
+            run_level, run_length = cell, 1
+
+    def draw(self):
+        height, width = self.stdscr.getmaxyx()
+        heatmap = self.heatmap
+        self.stdscr.erase()
+        try:
+            thresholds = metrics[heatmap.metric][1]
+            span = (heatmap.timestamps[-1] - heatmap.timestamps[0]) if len(heatmap.timestamps) > 1 else 0
+            header = (f"{heatmap.metric} heatmap, {len(heatmap.cells)} namespaces, last {len(heatmap.timestamps)} intervals "
+                      f"({span:.0f}s)  levels: {' '.join(str(t) for t in thresholds)}")
+            self.stdscr.addstr(0, 0, header[:width - 1], curses.A_BOLD)
+            for y, bdev_name in enumerate(heatmap.ordered()[self.top:self.top + height - 3], start=1):
+                row = heatmap.rows[bdev_name]
+                label = f"{row.nsid:>4} {row.rbd_pool_name}/{row.rbd_image_name}"
+                self.stdscr.addstr(y, 0, f"{label[:label_width]:<{label_width}}")
+                self._draw_cells(y, heatmap.cells[bdev_name])
+            self.stdscr.addstr(height - 1, 0, "q:quit  m:metric  up/down/pgup/pgdn:scroll"[:width - 1], curses.A_DIM)
+        except curses.error:
+            # terminal shrank mid draw, the resize key will trigger a full redraw
+            pass
+        self.stdscr.refresh()
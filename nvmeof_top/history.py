@@ -0,0 +1,140 @@
+import bisect
+import math
+import threading
+from array import array
+from nvmeof_top.snapshot import IORates, NamespaceRow, Snapshot
+from typing import Dict, Iterable, List, Optional, Tuple
+
+width = len(IORates._fields)
+_missing = array('d', [math.nan] * width)
+
+
+class History:
+    """Bounded per-namespace history of the last depth cycles
+
+    Every namespace has a ring of depth slots, each holding that cycle's IORates as doubles, so
+    any derived figure (IOPS, MB/s, await) can be produced with the IORates math. All rings share
+    the cycle's slot index and timestamp. Cycles where a namespace was absent, or its interval
+    was dropped by reset detection, are stored as NaN. A namespace missing for a full depth of
+    cycles is forgotten.
+    """
+
+    def __init__(self, depth: int):
+        self.depth = depth
+        self.lock = threading.Lock()
+        self.timestamps = array('d', [math.nan] * depth)
+        self.series: Dict[str, array] = {}
+        self.rows: Dict[str, NamespaceRow] = {}
+        self.head = 0
+        self.count = 0
+        self.version = 0
+        self._absent: Dict[str, int] = {}
+
+    def record(self, snapshot: Snapshot):
+        """Snapshot subscriber: store the cycle in the next slot"""
+        with self.lock:
+            slot = self.head
+            offset = slot * width
+            self.timestamps[slot] = snapshot.timestamp
+            seen = set()
+            for row in snapshot.rows:
+                series = self.series.get(row.bdev_name)
+                if series is None:
+                    series = array('d', [math.nan]) * (self.depth * width)
+                    self.series[row.bdev_name] = series
+                series[offset:offset + width] = array('d', row.rates) if row.valid else _missing
+                self.rows[row.bdev_name] = row
+                seen.add(row.bdev_name)
+
+            for bdev_name in [name for name in self.series if name not in seen]:
+                self.series[bdev_name][offset:offset + width] = _missing
+                self._absent[bdev_name] = self._absent.get(bdev_name, 0) + 1
+                if self._absent[bdev_name] >= self.depth:
+                    del self.series[bdev_name]
+                    del self.rows[bdev_name]
+                    del self._absent[bdev_name]
+            for bdev_name in seen:
+                self._absent.pop(bdev_name, None)
+
+            self.head = (slot + 1) % self.depth
+            self.count = min(self.count + 1, self.depth)
+            self.version = snapshot.version
+
+    def _order(self) -> List[int]:
+        """Slots from oldest to newest"""
+        first = (self.head - self.count) % self.depth
+        return [(first + i) % self.depth for i in range(self.count)]
+
+    def window(self, bdev_name: str) -> Tuple[List[float], List[Optional[IORates]]]:
+        """Timestamps and rates (None where not sampled) for one namespace, oldest first"""
+        with self.lock:
+            series = self.series.get(bdev_name)
+            slots = self._order()
+            timestamps = [self.timestamps[slot] for slot in slots]
+            if series is None:
+                return timestamps, [None] * len(slots)
+            rates = []
+            for slot in slots:
+                values = series[slot * width:(slot + 1) * width]
+                rates.append(None if math.isnan(values[0]) else IORates(*values))
+            return timestamps, rates
+
+    def aggregate(self, bdev_names: Iterable[str], start: float, end: float) -> Tuple[array, List[array], array]:
+        """Sum the namespaces' rates per cycle between start and end (inclusive), oldest first
+
+        Returns the timestamps, one array per IORates field holding the per cycle sums, and the
+        number of namespaces sampled in each cycle (0 where the sums are meaningless). Whole
+        field series are pulled out of each ring with a single strided slice.
+        """
+        with self.lock:
+            first = (self.head - self.count) % self.depth
+            timestamps = self.timestamps[first:] + self.timestamps[:first]
+            if self.count < self.depth:
+                timestamps = timestamps[:self.count]
+            lo = bisect.bisect_left(timestamps, start)
+            hi = bisect.bisect_right(timestamps, end)
+            timestamps = timestamps[lo:hi]
+            sums = [array('d', bytes(8 * len(timestamps))) for _ in range(width)]
+            samples = array('d', bytes(8 * len(timestamps)))
+            for bdev_name in bdev_names:
+                series = self.series.get(bdev_name)
+                if series is None:
+                    continue
+                ordered = series[first * width:] + series[:first * width]
+                ordered = ordered[lo * width:hi * width]
+                for field in range(width):
+                    values = ordered[field::width]
+                    total = sums[field]
+                    for idx, value in enumerate(values):
+                        if value == value:  # not NaN
+                            total[idx] += value
+                for idx, value in enumerate(ordered[0::width]):
+                    if value == value:
+                        samples[idx] += 1
+            return timestamps, sums, samples
+
+
+def downsample(timestamps: array, sums: List[array], samples: array, step: float) -> List[Tuple[float, Optional[IORates]]]:
+    """Average aggregated rates into buckets of step seconds (0 keeps every cycle)
+
+    Buckets are aligned to multiples of step, so repeated queries return stable points. Each
+    bucket's IORates is the mean over the cycles that had samples, so derived figures like await
+    stay weighted by operations. Buckets with no samples give None.
+    """
+    points = []
+    lo = 0
+    while lo < len(timestamps):
+        if step:
+            bucket_start = math.floor(timestamps[lo] / step) * step
+            hi = bisect.bisect_left(timestamps, bucket_start + step, lo)
+        else:
+            bucket_start = timestamps[lo]
+            hi = lo + 1
+        valid = [idx for idx in range(lo, hi) if samples[idx]]
+        if valid:
+            rates = IORates(*(sum(sums[field][idx] for idx in valid) / len(valid) for field in range(width)))
+        else:
+            rates = None
+        points.append((bucket_start, rates))
+        lo = hi
+    return points
@@ -0,0 +1,93 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import threading
+from typing import Dict, Tuple
+
+log_format = '%(asctime)s - %(levelname)-8s - %(name)s.%(funcName)s - %(message)s'
+
+
+class RepeatFilter(logging.Filter):
+    """Sample repeated messages, so per namespace logging can't flood the log
+
+    Records are grouped by logger, level and the unformatted message template, so messages
+    logged lazily (logger.debug("... %s", nsid)) for every namespace fall into one group. The
+    first `burst` records of a group pass in each `period` seconds, the rest are counted and the
+    count is reported on the group's next record to pass. Errors, and records logged with
+    extra={'sample': False}, are never suppressed.
+    """
+
+    max_groups = 1000
+
+    def __init__(self, burst: int = 10, period: float = 10.0):
+        super().__init__()
+        self.burst = burst
+        self.period = period
+        self.lock = threading.Lock()
+        # group -> [period start, records passed, records suppressed]
+        self.groups: Dict[Tuple[str, int, str], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.ERROR or not getattr(record, 'sample', True):
+            return True
+        key = (record.name, record.levelno, str(record.msg))
+        with self.lock:
+            group = self.groups.get(key)
+            if group is None:
+                if len(self.groups) >= self.max_groups:
+                    # eagerly formatted messages each form their own group, so forget idle ones
+                    self.groups = {key: group for key, group in self.groups.items()
+                                   if record.created - group[0] < self.period or group[2]}
+                self.groups[key] = [record.created, 1, 0]
+                return True
+            if record.created - group[0] >= self.period:
+                suppressed = group[2]
+                group[:] = [record.created, 1, 0]
+                if suppressed:
+                    record.msg = f"{record.msg} [{suppressed} similar messages suppressed]"
+                return True
+            if group[1] < self.burst:
+                group[1] += 1
+                return True
+            group[2] += 1
+            return False
+
+
+class _LocalQueueHandler(logging.handlers.QueueHandler):
+    """Queue records as they are, leaving all formatting to the listener's thread
+
+    QueueHandler.prepare() formats the message (and any traceback) so the record can be pickled,
+    but this queue never leaves the process. Lazy arguments are therefore rendered a little later,
+    on the listener's thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logging(log_file: str, level: str, max_bytes: int, backups: int) -> logging.handlers.QueueListener:
+    """Route all logging through a queue to a background writer thread
+
+    Callers only pay for the level check, sampling and enqueue. Formatting the line and the
+    file IO happen on the listener's thread. The log file is appended to and rotated by size, so
+    a daemon and its attached clients can share a directory without truncating each other's logs.
+    """
+    file_handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backups)
+    file_handler.setFormatter(logging.Formatter(log_format))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = _LocalQueueHandler(log_queue)
+    queue_handler.addFilter(RepeatFilter())
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper())
+
+    listener = logging.handlers.QueueListener(log_queue, file_handler)
+    listener.start()
+    # flush anything still queued when the interpreter exits
+    atexit.register(listener.stop)
+    return listener
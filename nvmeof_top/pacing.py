@@ -0,0 +1,125 @@
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# latency increases smaller than this are treated as noise rather than gateway load
+min_latency_rise = 0.001
+
+
+def latency_raised(latency: float, baseline: float, factor: float) -> bool:
+    return latency > factor * baseline and latency - baseline > min_latency_rise
+
+
+class FixedInterval:
+    """Poll at a constant interval (the default behaviour)"""
+
+    def __init__(self, delay: float):
+        self.interval = delay
+
+    def observe(self, cycle_secs: float, rpc_latency: Optional[float]) -> float:
+        return self.interval
+
+
+class AdaptiveInterval:
+    """Widen the polling interval when the gateway is struggling, and narrow it back when quiet
+
+    The gateway is considered busy when a collection cycle consumes more than busy_ratio of the
+    interval, or the mean RPC latency rises above latency_factor times its quiet baseline. Busy
+    cycles back off multiplicatively, quiet cycles step back toward the target. Rates remain
+    correct whatever the interval, since they are derived from each sample's own timestamps.
+    """
+
+    backoff = 1.5
+    recovery = 0.9
+    busy_ratio = 0.5
+    latency_factor = 2.0
+    baseline_alpha = 0.2
+
+    def __init__(self, target: float, min_delay: float, max_delay: float):
+        self.target = min(max(target, min_delay), max_delay)
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.interval = self.target
+        self.baseline_latency: Optional[float] = None
+
+    def _busy(self, cycle_secs: float, rpc_latency: Optional[float]) -> bool:
+        if cycle_secs > self.busy_ratio * self.interval:
+            return True
+        if rpc_latency is None:
+            return False
+        if self.baseline_latency is None:
+            self.baseline_latency = rpc_latency
+            return False
+        return latency_raised(rpc_latency, self.baseline_latency, self.latency_factor)
+
+    def observe(self, cycle_secs: float, rpc_latency: Optional[float]) -> float:
+        """Return the interval to wait before the next cycle"""
+        previous = self.interval
+        if self._busy(cycle_secs, rpc_latency):
+            self.interval = min(self.max_delay, self.interval * self.backoff)
+        else:
+            # only quiet cycles feed the latency baseline, so a struggling gateway can't raise it
+            if rpc_latency is not None and self.baseline_latency is not None:
+                self.baseline_latency += self.baseline_alpha * (rpc_latency - self.baseline_latency)
+            if self.interval > self.target:
+                self.interval = max(self.target, self.interval * self.recovery)
+            elif self.interval < self.target:
+                self.interval = min(self.target, self.interval / self.recovery)
+
+        if self.interval != previous:
+            logger.info(f"polling interval changed from {previous:.3f}s to {self.interval:.3f}s "
+                        f"(cycle {cycle_secs:.3f}s, rpc latency {rpc_latency or 0:.4f}s)")
+        return self.interval
+
+
+class FixedConcurrency:
+    """Keep a constant limit on in-flight namespace RPCs"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.max_limit = limit
+
+    def observe(self, cycle_secs: float, rpc_latency: Optional[float], namespaces: int) -> int:
+        return self.limit
+
+
+class ConcurrencyTuner:
+    """AIMD tuning of the in-flight namespace RPC limit
+
+    While RPC latency stays near its quiet baseline and the namespace count is still being held
+    back by the limit, the limit grows by one each cycle. When latency rises above
+    latency_factor times the baseline the gateway is saturating, so the limit is halved.
+    """
+
+    latency_factor = 1.5
+    baseline_alpha = 0.2
+
+    def __init__(self, initial: int = 8, max_limit: int = 64):
+        # a limit of 0 would leave every namespace fetch waiting for a slot forever
+        self.max_limit = max(1, max_limit)
+        self.limit = max(1, min(initial, self.max_limit))
+        self.baseline_latency: Optional[float] = None
+
+    def observe(self, cycle_secs: float, rpc_latency: Optional[float], namespaces: int) -> int:
+        """Return the limit to use for the next cycle"""
+        if rpc_latency is None:
+            return self.limit
+
+        previous = self.limit
+        if self.baseline_latency is None:
+            self.baseline_latency = rpc_latency
+        elif latency_raised(rpc_latency, self.baseline_latency, self.latency_factor):
+            if self.limit == 1:
+                # nothing left to back off, so accept the gateway's slower latency as the norm
+                self.baseline_latency = rpc_latency
+            self.limit = max(1, self.limit // 2)
+        else:
+            self.baseline_latency += self.baseline_alpha * (rpc_latency - self.baseline_latency)
+            if namespaces > self.limit:
+                self.limit = min(self.max_limit, self.limit + 1)
+
+        if self.limit != previous:
+            logger.info(f"RPC concurrency changed from {previous} to {self.limit} "
+                        f"(cycle {cycle_secs:.3f}s, rpc latency {rpc_latency:.4f}s)")
+        return self.limit
@@ -0,0 +1,95 @@
+import contextlib
+import cProfile
+import pstats
+import threading
+import time
+from collections import deque
+from nvmeof_top.utils import percentile
+from typing import Deque, Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+_null_stage = contextlib.nullcontext()
+
+
+class Profiler:
+    """Per-stage timing of nvmeof-top's own hot paths
+
+    rpc_wait, decode and counter_update are recorded per namespace call, the other stages once
+    per cycle. When disabled, stage() hands back a shared no-op context manager so the
+    instrumentation left in the hot paths costs next to nothing.
+    """
+
+    stages = ('rpc_wait', 'decode', 'counter_update', 'rates', 'cycle', 'format', 'write')
+
+    def __init__(self, enabled: bool = False, pstats_file: Optional[str] = None, max_samples: int = 100000):
+        self.enabled = enabled
+        self.pstats_file = pstats_file
+        self.timings: Dict[str, Deque[float]] = {stage: deque(maxlen=max_samples) for stage in Profiler.stages}
+        self._profiles: List[cProfile.Profile] = []
+        self._profiles_lock = threading.Lock()
+
+    def stage(self, name: str):
+        """Context manager recording the elapsed time of a stage"""
+        if not self.enabled:
+            return _null_stage
+        return self._timed(name)
+
+    @contextlib.contextmanager
+    def _timed(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name].append(time.perf_counter() - start)
+
+    def record(self, name: str, secs: float):
+        if self.enabled:
+            self.timings[name].append(secs)
+
+    @contextlib.contextmanager
+    def profile_thread(self):
+        """Run cProfile for the calling thread, when a pstats dump has been requested
+
+        cProfile only hooks the thread that enables it, so each long-lived thread wraps its own
+        work in this and the results are merged by dump().
+        """
+        if not (self.enabled and self.pstats_file):
+            yield
+            return
+
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            with self._profiles_lock:
+                self._profiles.append(profile)
+
+    def report(self) -> str:
+        """Return a table of per-stage timing percentiles (ms)"""
+        lines = ["{:<16} {:>8} {:>9} {:>9} {:>9} {:>9}".format('stage', 'count', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms')]
+        for stage in Profiler.stages:
+            values = sorted(self.timings[stage])
+            if not values:
+                continue
+            lines.append("{:<16} {:>8} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f}".format(
+                stage, len(values),
+                *(percentile(values, pct) * 1000 for pct in (50, 90, 99)),
+                values[-1] * 1000))
+        return "\n".join(lines) + "\n"
+
+    def dump(self):
+        """Merge the per-thread profiles into a single pstats file"""
+        with self._profiles_lock:
+            profiles = list(self._profiles)
+        if not (self.pstats_file and profiles):
+            return
+
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(self.pstats_file)
+        logger.info(f"cProfile data written to {self.pstats_file}")
@@ -0,0 +1,228 @@
+import bisect
+import gzip
+import json
+import os
+import threading
+import time
+import zlib
+from collections import deque
+from nvmeof_top.snapshot import Snapshot
+from typing import Deque, Dict, Iterator, List, Optional, Tuple, Union
+import logging
+
+logger = logging.getLogger(__name__)
+
+index_name = 'index.json'
+
+
+def _load_index(directory: str) -> List[Dict]:
+    try:
+        with open(os.path.join(directory, index_name)) as index_file:
+            return json.load(index_file)['segments']
+    except FileNotFoundError:
+        return []
+
+
+class Recorder:
+    """Write each published snapshot to compressed, time partitioned segment files
+
+    Snapshots are appended as JSON lines to a gzip segment, which is rotated once it holds
+    segment_bytes of data or is segment_age seconds old. index.json lists every segment with
+    its first and last timestamp, so readers can go straight to the segments covering a time
+    range. The oldest segments are deleted to keep the recording under max_bytes on disk.
+
+    The collection thread only queues records. Serialising, compressing and flushing happen on a
+    writer thread, and when depth records are already waiting the oldest is dropped and counted.
+    The index is rewritten when a segment rotates, and otherwise at most every index_interval
+    seconds, so the live segment's end time in index.json can lag a little behind its records.
+    """
+
+    depth = 256
+    index_interval = 10.0
+
+    def __init__(self, directory: str, segment_bytes: int, segment_age: float, max_bytes: int):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segment_age = segment_age
+        self.max_bytes = max_bytes
+        self.cond = threading.Condition()
+        self.pending: Deque[Tuple[Union[Snapshot, Dict], float]] = deque()
+        self.dropped = 0
+        self.segments = []
+        self._file: Optional[gzip.GzipFile] = None
+        self._segment: Optional[Dict] = None
+        self._written = 0
+        self._unreported = 0
+        self._closed = False
+        self._index_due: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.segments = _load_index(self.directory)
+        self._thread = threading.Thread(target=self._run, name='recorder', daemon=True)
+        self._thread.start()
+        logger.info(f"recording snapshots to {self.directory} ({len(self.segments)} existing segments)")
+
+    def _write_index(self):
+        path = os.path.join(self.directory, index_name)
+        with open(f"{path}.tmp", 'w') as index_file:
+            json.dump({'segments': self.segments}, index_file)
+        os.replace(f"{path}.tmp", path)
+        self._index_due = None
+
+    def _open_segment(self, timestamp: float):
+        name = time.strftime('segment-%Y%m%d-%H%M%S', time.gmtime(timestamp)) + f"-{int(timestamp * 1000) % 1000:03d}.jsonl.gz"
+        self._file = gzip.open(os.path.join(self.directory, name), 'wb')
+        self._segment = {'file': name, 'start': timestamp, 'end': timestamp, 'records': 0}
+        self._written = 0
+        self.segments.append(self._segment)
+
+    def _close_segment(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+            self._segment = None
+
+    def _enforce_retention(self):
+        sizes = []
+        for segment in self.segments:
+            try:
+                sizes.append(os.path.getsize(os.path.join(self.directory, segment['file'])))
+            except OSError:
+                sizes.append(0)
+        total = sum(sizes)
+        # never remove the segment being written
+        while total > self.max_bytes and len(self.segments) > 1:
+            segment = self.segments.pop(0)
+            total -= sizes.pop(0)
+            try:
+                os.unlink(os.path.join(self.directory, segment['file']))
+            except OSError:
+                pass
+            logger.info(f"removed recording segment {segment['file']} to stay within size limit")
+
+    def record(self, snapshot: Snapshot):
+        """Snapshot subscriber: queue one record for the writer thread"""
+        self._submit(snapshot, snapshot.timestamp)
+
+    def record_event(self, event: Dict):
+        """Queue a timestamped event (e.g. a trace capture window) between the snapshots"""
+        self._submit(event, event['timestamp'])
+
+    def _submit(self, record: Union[Snapshot, Dict], timestamp: float):
+        with self.cond:
+            if len(self.pending) >= self.depth:
+                self.pending.popleft()
+                self.dropped += 1
+                self._unreported += 1
+            self.pending.append((record, timestamp))
+            self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.pending and not self._closed:
+                    if self._index_due is None:
+                        self.cond.wait()
+                    elif not self.cond.wait(max(0.0, self._index_due - time.monotonic())):
+                        break
+                batch = list(self.pending)
+                self.pending.clear()
+                closed = self._closed
+                dropped, self._unreported = self._unreported, 0
+
+            if dropped:
+                logger.warning("recording fell behind, %d records dropped", dropped)
+            try:
+                for record, timestamp in batch:
+                    self._append(record.to_dict() if isinstance(record, Snapshot) else record, timestamp)
+                if closed:
+                    self._close_segment()
+                    self._write_index()
+                    return
+                if self._index_due is not None and time.monotonic() >= self._index_due:
+                    self._write_index()
+            except OSError as err:
+                logger.error(f"unable to write recording to {self.directory}: {err}")
+                if closed:
+                    return
+
+    def _append(self, record: Dict, timestamp: float):
+        line = json.dumps(record, separators=(',', ':')).encode() + b'\n'
+        if self._segment:
+            age = timestamp - self._segment['start']
+            if self._written >= self.segment_bytes or age >= self.segment_age:
+                self._close_segment()
+        rotated = self._file is None
+        if rotated:
+            self._open_segment(timestamp)
+
+        self._file.write(line)
+        # a sync flush keeps the live segment readable by queries and replay
+        self._file.flush(zlib.Z_SYNC_FLUSH)
+        self._written += len(line)
+        self._segment['end'] = timestamp
+        self._segment['records'] += 1
+
+        if rotated:
+            self._enforce_retention()
+            self._write_index()
+        elif self._index_due is None:
+            self._index_due = time.monotonic() + self.index_interval
+
+    def stop(self, timeout: float = 5):
+        """Write out what is queued, close the live segment and bring the index up to date"""
+        if not self._thread:
+            return
+        with self.cond:
+            self._closed = True
+            self.cond.notify()
+        self._thread.join(timeout=timeout)
+        if self._thread.is_alive():
+            logger.warning(f"recording still blocked after {timeout}s, {len(self.pending)} records not written")
+
+
+class RecordingReader:
+    """Read snapshots from a recording directory, using the index to skip unneeded segments"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.segments = sorted(_load_index(directory), key=lambda segment: segment['start'])
+
+    def segments_between(self, start: Optional[float] = None, end: Optional[float] = None) -> List[Dict]:
+        """Segments that may hold records between start and end"""
+        starts = [segment['start'] for segment in self.segments]
+        first = 0 if start is None else max(0, bisect.bisect_right(starts, start) - 1)
+        last = len(self.segments) if end is None else bisect.bisect_right(starts, end)
+        # the index is only rewritten every so often, so the last segment may run past its end
+        return [segment for segment in self.segments[first:last]
+                if start is None or segment['end'] >= start or segment is self.segments[-1]]
+
+    def snapshots(self, start: Optional[float] = None, end: Optional[float] = None) -> Iterator[Snapshot]:
+        for record in self.records(start, end):
+            if 'event' not in record:
+                yield Snapshot.from_dict(record)
+
+    def events(self, start: Optional[float] = None, end: Optional[float] = None) -> Iterator[Dict]:
+        for record in self.records(start, end):
+            if 'event' in record:
+                yield record
+
+    def records(self, start: Optional[float] = None, end: Optional[float] = None) -> Iterator[Dict]:
+        for segment in self.segments_between(start, end):
+            path = os.path.join(self.directory, segment['file'])
+            try:
+                with gzip.open(path, 'rb') as segment_file:
+                    for line in segment_file:
+                        record = json.loads(line)
+                        if start is not None and record['timestamp'] < start:
+                            continue
+                        if end is not None and record['timestamp'] > end:
+                            return
+                        yield record
+            except FileNotFoundError:
+                logger.warning(f"recording segment {segment['file']} is missing")
+            except (EOFError, zlib.error, ValueError):
+                # the live segment, or one cut short by a crash, ends without a gzip trailer
+                logger.debug(f"recording segment {segment['file']} ends early")
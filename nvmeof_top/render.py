@@ -0,0 +1,74 @@
+from nvmeof_top.snapshot import NamespaceRow, Snapshot
+from nvmeof_top.utils import lb_group
+from typing import Dict, List, Tuple
+
+text_headers = ['NSID', 'RBD pool/image', 'IOPS', 'r/s', 'rMB/s', 'r_await', 'rareq-sz', 'w/s', 'wMB/s', 'w_await', 'wareq-sz', 'LBGrp', 'QoS']
+text_template = "{:>4}  {:<32}    {:>7}  {:>6}   {:>6}  {:>7}  {:>8}  {:>6}  {:>6}  {:>7}  {:>8}  {:^5}   {:>3}\n"
+heading = text_template.format(*text_headers)
+
+# the text_template columns split into the parts that only change with topology, and the
+# numeric middle. %d truncates like int(), and the widths match text_template
+_prefix_template = "{:>4}  {:<32}    "
+_suffix_template = "  {:^5}   {:>3}\n"
+_numeric_template = "%7d  %6d   %6.2f  %7.2f  %8.2f  %6d  %6.2f  %7.2f  %8.2f"
+_invalid_cells = "{:>7}  {:>6}   {:>6}  {:>7}  {:>8}  {:>6}  {:>6}  {:>7}  {:>8}".format(*['-'] * 9)
+_MiB = 1 / (1024 * 1024)
+
+
+def qos_enabled(ns) -> str:
+    if (ns.rw_ios_per_second or ns.rw_mbytes_per_second or ns.r_mbytes_per_second or ns.w_mbytes_per_second):
+        return "Yes"
+    return "No"
+
+
+def _static_key(row: NamespaceRow) -> Tuple:
+    return (row.nsid, row.rbd_pool_name, row.rbd_image_name, row.load_balancing_group, row.rw_ios_per_second,
+            row.rw_mbytes_per_second, row.r_mbytes_per_second, row.w_mbytes_per_second)
+
+
+class RowRenderer:
+    """Render namespace rows as batch mode text, caching the static cells per topology
+
+    NSID, pool/image, LB group and QoS only change with the subsystem's topology, so they are
+    formatted once into a prefix and suffix per namespace. While a snapshot carries the same
+    topology id as the cache, the cached cells are used as they are; otherwise each row's static
+    fields are checked against the cache. The numeric cells of a row are produced by a single
+    %-format call.
+    """
+
+    def __init__(self):
+        self.topology = 0
+        self.cache: Dict[str, Tuple[Tuple, str, str]] = {}
+
+    def _static(self, row: NamespaceRow) -> Tuple[Tuple, str, str]:
+        rbd_info = f"{row.rbd_pool_name}/{row.rbd_image_name}"
+        entry = (_static_key(row), _prefix_template.format(row.nsid, rbd_info),
+                 _suffix_template.format(lb_group(row.load_balancing_group), qos_enabled(row)))
+        self.cache[row.bdev_name] = entry
+        return entry
+
+    def render(self, snapshot: Snapshot, rows: List[NamespaceRow]) -> List[str]:
+        """Return one text line per row"""
+        trusted = snapshot.topology and snapshot.topology == self.topology
+        if not trusted:
+            if len(self.cache) > 2 * len(snapshot.rows):
+                # namespaces have come and gone, so start afresh rather than grow
+                self.cache = {}
+            self.topology = snapshot.topology
+
+        cache = self.cache
+        numeric = _numeric_template
+        lines = []
+        for row in rows:
+            entry = cache.get(row.bdev_name)
+            if entry is None or (not trusted and entry[0] != _static_key(row)):
+                entry = self._static(row)
+            if row.valid:
+                rates = row.rates
+                cells = numeric % (rates.read_ops + rates.write_ops, rates.read_ops, rates.read_bytes * _MiB, rates.r_await,
+                                   rates.rareq_sz, rates.write_ops, rates.write_bytes * _MiB, rates.w_await, rates.wareq_sz)
+            else:
+                # interval dropped by reset detection, so there is no meaningful rate to show
+                cells = _invalid_cells
+            lines.append(entry[1] + cells + entry[2])
+        return lines
@@ -0,0 +1,56 @@
+import fnmatch
+import regex
+from typing import List, Optional, Sequence
+import logging
+
+logger = logging.getLogger(__name__)
+
+regex_prefix = 're:'
+
+
+def compile_patterns(patterns: Sequence[str]):
+    """Combine glob and 're:' prefixed regex patterns into a single compiled matcher"""
+    parts = []
+    for pattern in patterns:
+        if pattern.startswith(regex_prefix):
+            parts.append(f"(?:{pattern[len(regex_prefix):]})\\Z")
+        else:
+            parts.append(fnmatch.translate(pattern))
+    return regex.compile('|'.join(parts))
+
+
+class NamespaceSelector:
+    """Restrict collection to namespaces matching nsid, pool and image patterns
+
+    Patterns are globs, or regular expressions when prefixed with 're:'. A namespace is selected
+    when it matches at least one pattern of every selector given. The patterns are compiled once,
+    and the namespace list is only re-evaluated when the subsystem's topology changes.
+    """
+
+    def __init__(self, nsids: Optional[List[str]] = None, pools: Optional[List[str]] = None,
+                 images: Optional[List[str]] = None):
+        self.matchers = []
+        for attr, patterns in (('nsid', nsids), ('rbd_pool_name', pools), ('rbd_image_name', images)):
+            if patterns:
+                self.matchers.append((attr, compile_patterns(patterns).match))
+        self._signature = None
+        self._indices: List[int] = []
+
+    @property
+    def active(self) -> bool:
+        return bool(self.matchers)
+
+    def matches(self, ns) -> bool:
+        return all(match(str(getattr(ns, attr))) for attr, match in self.matchers)
+
+    def select(self, namespaces: Sequence) -> List:
+        """Return the namespaces that match the selectors"""
+        if not self.matchers:
+            return list(namespaces)
+
+        signature = tuple((ns.nsid, ns.rbd_pool_name, ns.rbd_image_name) for ns in namespaces)
+        if signature != self._signature:
+            self._signature = signature
+            self._indices = [idx for idx, ns in enumerate(namespaces) if self.matches(ns)]
+            logger.info(f"topology changed, watching {len(self._indices)} of {len(namespaces)} namespaces")
+        return [namespaces[idx] for idx in self._indices]
@@ -0,0 +1,369 @@
+import bisect
+import heapq
+import math
+import random
+import time
+import uuid
+import grpc
+import nvmeof_top.proto.gateway_pb2 as pb2
+from nvmeof_top.clock import SimulatedClock
+from nvmeof_top.collector import DataCollector
+from nvmeof_top.snapshot import IORates, Snapshot
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+subsystem_nqn = 'nqn.2016-06.io.spdk:simulated'
+tick_rate = 1000000
+day = 86400
+
+
+class Window(NamedTuple):
+    """A period of the scenario, in secs from the start of the simulation"""
+    start: float
+    duration: float
+    factor: float = 1.0
+
+    def covers(self, secs: float) -> bool:
+        return self.start <= secs < self.start + self.duration
+
+
+def timeline(windows: Sequence[Window]) -> Tuple[List[float], List[float]]:
+    """Flatten possibly overlapping windows into boundaries and the largest factor between each"""
+    bounds = sorted({edge for window in windows for edge in (window.start, window.start + window.duration)})
+    factors = [1.0]
+    for bound in bounds:
+        factors.append(max((window.factor for window in windows if window.covers(bound)), default=1.0))
+    return bounds, factors
+
+
+class Scenario:
+    """What the simulated gateway does, and when
+
+    spikes multiply RPC latency and namespace await by their factor while they last. A restart
+    resets the gateway's tick and IO counters. Every churn_every secs a namespace is deleted and
+    a new one added, and every recreate_every secs a namespace is deleted and re-added under the
+    same bdev with a new uuid. During an outage every RPC fails.
+    """
+
+    def __init__(self, namespaces: int = 20, seed: int = 1, rpc_latency: float = 0.002, capacity: int = 8,
+                 spikes: Sequence[Window] = (), restarts: Sequence[float] = (), outages: Sequence[Window] = (),
+                 churn_every: float = 0.0, recreate_every: float = 0.0):
+        self.namespaces = namespaces
+        self.seed = seed
+        self.rpc_latency = rpc_latency
+        self.capacity = capacity
+        self.spikes = list(spikes)
+        self.restarts = sorted(restarts)
+        self.outages = list(outages)
+        self.churn_every = churn_every
+        self.recreate_every = recreate_every
+
+    @classmethod
+    def day(cls, namespaces: int = 20, seed: int = 1) -> 'Scenario':
+        """Hourly two minute latency spikes, restarts at 06:00 and 18:00, and regular churn"""
+        return cls(namespaces=namespaces, seed=seed,
+                   spikes=[Window(hour * 3600 + 1800, 120, 8.0) for hour in range(24)],
+                   restarts=[6 * 3600, 18 * 3600], churn_every=1200, recreate_every=3 * 3600)
+
+
+class SimulatedRpcError(grpc.RpcError):
+
+    def code(self):
+        return grpc.StatusCode.UNAVAILABLE
+
+    def details(self):
+        return "simulated gateway outage"
+
+
+class Sample(NamedTuple):
+    """The counters served for one namespace_get_io_stats call"""
+    boot: float
+    uuid: str
+    ticks: int
+    values: Tuple[int, ...]
+
+
+class SimNamespace:
+    """A namespace with a diurnal workload, whose IO counters follow a closed form"""
+
+    def __init__(self, nsid: int, bdev_name: str, created: float, rng: random.Random):
+        self.nsid = nsid
+        self.bdev_name = bdev_name
+        self.uuid = str(uuid.UUID(int=rng.getrandbits(128)))
+        self.created = created
+        self.read_iops = rng.uniform(50, 5000)
+        self.write_iops = rng.uniform(10, 2000)
+        self.read_size = rng.choice((4096, 8192, 65536))
+        self.write_size = rng.choice((4096, 16384))
+        self.read_await = rng.uniform(0.0002, 0.002)
+        self.write_await = rng.uniform(0.0005, 0.005)
+        self.amplitude = rng.uniform(0.0, 0.8)
+        self.phase = rng.uniform(0.0, 2 * math.pi)
+        self.lbgroup = rng.randint(0, 3)
+        self.boot = -1.0
+        self.last = 0.0
+        self.latency = [0.0, 0.0]
+
+    def ops(self, base_iops: float, secs: float) -> float:
+        """Operations since the start of the simulation, integrating base * (1 + a * sin)"""
+        omega = 2 * math.pi / day
+        return base_iops * (secs + self.amplitude / omega * (math.cos(self.phase) - math.cos(omega * secs + self.phase)))
+
+    def sample(self, secs: float, boot: float, factor: float) -> Sample:
+        base = max(self.created, boot)
+        if boot != self.boot:
+            self.boot, self.last, self.latency = boot, base, [0.0, 0.0]
+        # latency accumulates at the await in force when sampled
+        reads = self.ops(self.read_iops, secs) - self.ops(self.read_iops, self.last)
+        writes = self.ops(self.write_iops, secs) - self.ops(self.write_iops, self.last)
+        self.latency[0] += reads * self.read_await * factor
+        self.latency[1] += writes * self.write_await * factor
+        self.last = secs
+        read_ops = int(self.ops(self.read_iops, secs) - self.ops(self.read_iops, base))
+        write_ops = int(self.ops(self.write_iops, secs) - self.ops(self.write_iops, base))
+        return Sample(boot, self.uuid, int((secs - boot) * tick_rate), (
+            read_ops, read_ops * self.read_size, int(self.latency[0] * tick_rate),
+            write_ops, write_ops * self.write_size, int(self.latency[1] * tick_rate)))
+
+    def message(self) -> pb2.namespace_cli:
+        return pb2.namespace_cli(nsid=self.nsid, bdev_name=self.bdev_name, uuid=self.uuid, rbd_pool_name='rbd',
+                                 rbd_image_name=f"sim-{self.nsid}", load_balancing_group=self.lbgroup)
+
+
+class SimulatedGateway:
+    """A gateway scripted by a Scenario, standing in for GatewayClient
+
+    Provides the surface the collector uses (server, stub and raw_method), with each RPC taking
+    virtual time on a SimulatedClock. Latency grows once more calls are in flight than the
+    scenario's capacity, so the concurrency tuner has something to react to. The last two
+    samples served for each bdev are kept, so the rates the collector should report are known.
+    """
+
+    server = 'simulated:5500'
+
+    def __init__(self, clock: SimulatedClock, scenario: Scenario):
+        self.clock = clock
+        self.scenario = scenario
+        self.rng = random.Random(scenario.seed)
+        self.boot = 0.0
+        self.restarts = list(scenario.restarts)
+        self.next_nsid = 1
+        self.namespaces: Dict[int, SimNamespace] = {}
+        for _ in range(scenario.namespaces):
+            self._add(0.0)
+        self.spikes = timeline(scenario.spikes)
+        # outages as a factor of 0 within the window
+        self.outages = timeline([outage._replace(factor=0.0) for outage in scenario.outages])
+        self.next_churn = scenario.churn_every or math.inf
+        self.next_recreate = scenario.recreate_every or math.inf
+        self._listing: Optional[pb2.namespaces_info] = None
+        self._completions: List[float] = []
+        self.served: Dict[str, Tuple[Optional[Sample], Sample]] = {}
+        self.calls = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.churned = 0
+        self.recreated = 0
+
+    def connect(self):
+        pass
+
+    @property
+    def stub(self):
+        return self
+
+    def raw_method(self, method_name: str):
+        method = getattr(self, method_name)
+        return lambda request: method(request).SerializeToString()
+
+    def _add(self, secs: float):
+        nsid = self.next_nsid
+        self.next_nsid += 1
+        self.namespaces[nsid] = SimNamespace(nsid, f"bdev_sim_{nsid}", secs, self.rng)
+
+    @staticmethod
+    def _lookup(timeline: Tuple[List[float], List[float]], secs: float) -> float:
+        bounds, factors = timeline
+        return factors[bisect.bisect_right(bounds, secs)]
+
+    def _factor(self, secs: float) -> float:
+        return self._lookup(self.spikes, secs)
+
+    def _rpc(self) -> float:
+        """Take an RPC's latency in virtual time, returning the time it completes at"""
+        secs = self.clock.monotonic()
+        while self.restarts and self.restarts[0] <= secs:
+            self.boot = self.restarts.pop(0)
+        if not self._lookup(self.outages, secs):
+            raise SimulatedRpcError()
+        completions = self._completions
+        while completions and completions[0] <= secs:
+            heapq.heappop(completions)
+        latency = self.scenario.rpc_latency * self._factor(secs) * max(1.0, (len(completions) + 1) / self.scenario.capacity)
+        heapq.heappush(completions, secs + latency)
+        self.calls += 1
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+        self.clock.sleep(latency)
+        return secs + latency
+
+    def _churn(self, secs: float):
+        """Apply namespace changes that are due, so they show up in the next listing"""
+        while self.next_churn <= secs:
+            del self.namespaces[self.rng.choice(sorted(self.namespaces))]
+            self._add(self.next_churn)
+            self.next_churn += self.scenario.churn_every
+            self.churned += 1
+            self._listing = None
+        while self.next_recreate <= secs:
+            ns = self.namespaces[self.rng.choice(sorted(self.namespaces))]
+            self.namespaces[ns.nsid] = SimNamespace(ns.nsid, ns.bdev_name, self.next_recreate, self.rng)
+            self.next_recreate += self.scenario.recreate_every
+            self.recreated += 1
+            self._listing = None
+
+    def get_gateway_info(self, request) -> pb2.gateway_info:
+        self._rpc()
+        return pb2.gateway_info(name='simulated', status=0)
+
+    def list_namespaces(self, request) -> pb2.namespaces_info:
+        self._churn(self._rpc())
+        if self._listing is None:
+            self._listing = pb2.namespaces_info(status=0, subsystem_nqn=subsystem_nqn, namespaces=[
+                ns.message() for _nsid, ns in sorted(self.namespaces.items())])
+        return self._listing
+
+    def namespace_get_io_stats(self, request) -> pb2.namespace_io_stats_info:
+        secs = self._rpc()
+        ns = self.namespaces.get(request.nsid)
+        if ns is None:
+            return pb2.namespace_io_stats_info(status=2)
+        sample = ns.sample(secs, self.boot, self._factor(secs))
+        previous = self.served.get(ns.bdev_name)
+        self.served[ns.bdev_name] = (previous[1] if previous else None, sample)
+        read_ops, read_bytes, read_ticks, write_ops, write_bytes, write_ticks = sample.values
+        return pb2.namespace_io_stats_info(
+            status=0, subsystem_nqn=subsystem_nqn, nsid=ns.nsid, uuid=ns.uuid, bdev_name=ns.bdev_name,
+            tick_rate=tick_rate, ticks=sample.ticks, num_read_ops=read_ops, bytes_read=read_bytes,
+            read_latency_ticks=read_ticks, num_write_ops=write_ops, bytes_written=write_bytes,
+            write_latency_ticks=write_ticks)
+
+    def list_subsystems(self, request) -> pb2.subsystems_info_cli:
+        self._rpc()
+        return pb2.subsystems_info_cli()
+
+    def list_connections(self, request) -> pb2.connections_info:
+        self._rpc()
+        return pb2.connections_info()
+
+
+def expected_rates(previous: Optional[Sample], current: Sample) -> Optional[IORates]:
+    """The rates a correct collector reports for an interval, or None when it must be dropped"""
+    if previous is None or previous.uuid != current.uuid or previous.boot != current.boot:
+        return None
+    interval = (current.ticks - previous.ticks) / tick_rate
+    if interval <= 0:
+        return None
+    old, new = previous.values, current.values
+    return IORates(
+        (new[0] - old[0]) / interval, (new[1] - old[1]) / interval, (new[2] - old[2]) / tick_rate / interval,
+        (new[3] - old[3]) / interval, (new[4] - old[4]) / interval, (new[5] - old[5]) / tick_rate / interval)
+
+
+class SimulationCheck:
+    """Check each published snapshot against the gateway, and stop the run after duration secs
+
+    Rows are compared with the rates derived directly from the samples served, so a wrong
+    interval, a missed or false counter reset, or a rate computed from the wrong baseline all
+    show up. Scheduling figures (interval, cycle period, concurrency) are gathered as it goes.
+    """
+
+    def __init__(self, gateway: SimulatedGateway, collector: DataCollector, duration: float):
+        self.gateway = gateway
+        self.collector = collector
+        self.duration = duration
+        self.snapshots = 0
+        self.rows = 0
+        self.dropped = 0
+        self.missed_resets = 0
+        self.false_resets = 0
+        self.rate_errors = 0
+        self.periods: List[float] = []
+        self.intervals: List[float] = []
+        self.concurrency: List[int] = []
+        self._last_timestamp: Optional[float] = None
+
+    def observe(self, snapshot: Snapshot):
+        self.snapshots += 1
+        if self._last_timestamp is not None:
+            self.periods.append(snapshot.timestamp - self._last_timestamp)
+        self._last_timestamp = snapshot.timestamp
+        self.intervals.append(snapshot.interval)
+        self.concurrency.append(self.collector.rpc_limit)
+
+        for row in snapshot.rows:
+            self.rows += 1
+            expected = expected_rates(*self.gateway.served[row.bdev_name])
+            if expected is None:
+                if row.valid:
+                    self.missed_resets += 1
+                else:
+                    self.dropped += 1
+            elif not row.valid:
+                self.false_resets += 1
+            elif not all(math.isclose(got, want, rel_tol=1e-9, abs_tol=1e-9) for got, want in zip(row.rates, expected)):
+                self.rate_errors += 1
+                logger.warning("rates for %s differ, got %s expected %s", row.bdev_name, row.rates, expected)
+
+        if self.gateway.clock.monotonic() >= self.duration:
+            self.collector.stop()
+
+    @property
+    def passed(self) -> bool:
+        return not (self.missed_resets or self.false_resets or self.rate_errors)
+
+
+def simulate(scenario: Scenario, duration: float, pacer, concurrency, stagger: bool = False,
+             evict_after: int = 10) -> Tuple[SimulationCheck, float]:
+    """Run a collector against the scenario for duration secs of virtual time
+
+    Returns the check, and the wall clock secs the run took. The run ends early if the collector
+    gives up, e.g. during an outage, leaving the reason in the collector's health.
+    """
+    clock = SimulatedClock()
+    gateway = SimulatedGateway(clock, scenario)
+    collector = DataCollector(gateway, pacer.interval, subsystem_nqn, pacer=pacer, concurrency=concurrency,
+                              stagger=stagger, evict_after=evict_after, clock=clock)
+    check = SimulationCheck(gateway, collector, duration)
+    start = time.perf_counter()
+    collector.initialise()
+    collector.subscribe(check.observe)
+    collector.run()
+    return check, time.perf_counter() - start
+
+
+def _spread(values: Sequence[float]) -> str:
+    if not values:
+        return '-'
+    return f"min {min(values):.3f} mean {sum(values) / len(values):.3f} max {max(values):.3f}"
+
+
+def format_report(check: SimulationCheck, wall_secs: float) -> str:
+    gateway, collector = check.gateway, check.collector
+    simulated = gateway.clock.monotonic()
+    lines = [
+        f"simulated {simulated / 3600:.2f}h in {wall_secs:.2f}s ({simulated / wall_secs:.0f}x real time)",
+        f"snapshots {check.snapshots}, rows {check.rows}, intervals dropped on reset {check.dropped}",
+        f"gateway: {gateway.calls} RPCs, latency mean {gateway.latency_total / max(1, gateway.calls) * 1000:.2f}ms "
+        f"max {gateway.latency_max * 1000:.2f}ms, {gateway.churned} namespaces replaced, {gateway.recreated} re-created",
+        f"interval (s): {_spread(check.intervals)}",
+        f"cycle period (s): {_spread(check.periods)}",
+        f"concurrency: {_spread(check.concurrency)}",
+        f"collector: {len(collector.iostats)} entries, {collector.evicted} evicted",
+        f"missed resets {check.missed_resets}, false resets {check.false_resets}, rate errors {check.rate_errors}",
+    ]
+    if not collector.ready:
+        lines.append(f"collector stopped at {simulated:.1f}s: {collector.health.msg}")
+    return '\n'.join(lines) + '\n'
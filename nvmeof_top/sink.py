@@ -0,0 +1,115 @@
+import threading
+from collections import deque
+from nvmeof_top.profiler import Profiler
+from nvmeof_top.snapshot import IORates, Snapshot
+from typing import Callable, Deque, List, TextIO
+import logging
+
+logger = logging.getLogger(__name__)
+
+policies = ('drop-oldest', 'drop-newest', 'coalesce')
+
+
+def coalesce(older: Snapshot, newer: Snapshot) -> Snapshot:
+    """Combine consecutive snapshots into one covering both intervals
+
+    Rates are averaged, weighted by each snapshot's interval. A namespace whose newer interval
+    was dropped by reset detection keeps its older rates.
+    """
+    total = older.interval + newer.interval
+    previous = {row.bdev_name: row for row in older.rows if row.valid}
+    rows = []
+    for row in newer.rows:
+        old = previous.get(row.bdev_name)
+        if old is None or not total:
+            rows.append(row)
+        elif not row.valid:
+            rows.append(row._replace(rates=old.rates, valid=True))
+        else:
+            rates = IORates(*((old_rate * older.interval + new_rate * newer.interval) / total
+                              for old_rate, new_rate in zip(old.rates, row.rates)))
+            rows.append(row._replace(rates=rates))
+    return Snapshot(newer.version, newer.timestamp, total, tuple(rows), newer.topology)
+
+
+class OutputSink:
+    """Render and write batch output on a background thread
+
+    The main loop only queues snapshots, so a slow pipe never delays it and --count still counts
+    collection intervals. When depth snapshots are already waiting, the policy decides what
+    gives: drop-oldest discards the oldest pending snapshot, drop-newest discards the incoming
+    one, and coalesce merges the incoming snapshot into the newest pending one, so every interval
+    is still covered at a coarser resolution. Losses are noted in the output and counted.
+    """
+
+    def __init__(self, render: Callable[[Snapshot], str], stream: TextIO, depth: int, policy: str,
+                 profiler: Profiler):
+        self.render = render
+        self.stream = stream
+        self.depth = depth
+        self.policy = policy
+        self.profiler = profiler
+        self.cond = threading.Condition()
+        # each entry is [snapshot, number of intervals merged into it]
+        self.pending: Deque[List] = deque()
+        self.dropped = 0
+        self.coalesced = 0
+        self.broken = False
+        self._unreported = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='output-sink', daemon=True)
+        self._thread.start()
+
+    def submit(self, snapshot: Snapshot):
+        with self.cond:
+            if len(self.pending) >= self.depth:
+                if self.policy == 'coalesce':
+                    newest = self.pending[-1]
+                    newest[0] = coalesce(newest[0], snapshot)
+                    newest[1] += 1
+                    self.coalesced += 1
+                    return
+                self.dropped += 1
+                self._unreported += 1
+                if self.policy == 'drop-newest':
+                    return
+                self.pending.popleft()
+            self.pending.append([snapshot, 1])
+            self.cond.notify()
+
+    def _run(self):
+        with self.profiler.profile_thread():
+            while True:
+                with self.cond:
+                    while not self.pending and not self._closed:
+                        self.cond.wait()
+                    if not self.pending:
+                        return
+                    snapshot, intervals = self.pending.popleft()
+                    dropped, self._unreported = self._unreported, 0
+
+                with self.profiler.stage('format'):
+                    text = self.render(snapshot)
+                if intervals > 1:
+                    text = f"<output fell behind, {intervals} intervals coalesced>\n{text}"
+                if dropped:
+                    text = f"<output fell behind, {dropped} intervals dropped>\n{text}"
+                    logger.warning("output fell behind, %d intervals dropped", dropped)
+                try:
+                    with self.profiler.stage('write'):
+                        self.stream.write(text)
+                        self.stream.flush()
+                except OSError as err:
+                    # typically a closed pipe, so there is nobody left to write to
+                    logger.info(f"output closed: {err}")
+                    self.broken = True
+                    return
+
+    def close(self, timeout: float):
+        """Write out what is pending, giving up after timeout if the consumer has stalled"""
+        with self.cond:
+            self._closed = True
+            self.cond.notify()
+        self._thread.join(timeout=timeout)
+        if self._thread.is_alive():
+            logger.warning(f"output still blocked after {timeout}s, {len(self.pending)} intervals not written")
@@ -0,0 +1,113 @@
+from typing import NamedTuple, Tuple
+
+
+class IORates(NamedTuple):
+    """Per second rates for a namespace, derived from its last two samples"""
+    read_ops: float
+    read_bytes: float
+    read_secs: float
+    write_ops: float
+    write_bytes: float
+    write_secs: float
+
+    @property
+    def total_iops(self) -> float:
+        return self.read_ops + self.write_ops
+
+    @property
+    def rareq_sz(self) -> float:
+        """Average read request size in KiB"""
+        return (int(self.read_bytes / self.read_ops) / 1024) if self.read_ops else 0.0
+
+    @property
+    def wareq_sz(self) -> float:
+        """Average write request size in KiB"""
+        return (int(self.write_bytes / self.write_ops) / 1024) if self.write_ops else 0.0
+
+    @property
+    def r_await(self) -> float:
+        """Average read latency in ms"""
+        return ((self.read_secs / self.read_ops) * 1000) if self.read_ops else 0.0
+
+    @property
+    def w_await(self) -> float:
+        """Average write latency in ms"""
+        return ((self.write_secs / self.write_ops) * 1000) if self.write_ops else 0.0
+
+    @property
+    def total_await(self) -> float:
+        """Average latency across reads and writes in ms"""
+        ops = self.read_ops + self.write_ops
+        return (((self.read_secs + self.write_secs) / ops) * 1000) if ops else 0.0
+
+
+class NamespaceRow(NamedTuple):
+    """A namespace's metadata and rates for one cycle, decoupled from the protobuf message
+
+    Field names match namespace_cli, so helpers like lb_group() and qos_enabled() accept either.
+    valid is False when the interval was dropped by reset detection, in which case rates are zero
+    and should not be included in aggregates.
+    """
+    nsid: int
+    bdev_name: str
+    uuid: str
+    rbd_pool_name: str
+    rbd_image_name: str
+    load_balancing_group: int
+    rw_ios_per_second: int
+    rw_mbytes_per_second: int
+    r_mbytes_per_second: int
+    w_mbytes_per_second: int
+    rates: IORates
+    valid: bool = True
+
+    @classmethod
+    def from_ns(cls, ns, rates: IORates, valid: bool = True) -> 'NamespaceRow':
+        """Copy the fields we need out of a namespace_cli message"""
+        return cls(ns.nsid, ns.bdev_name, ns.uuid, ns.rbd_pool_name, ns.rbd_image_name, ns.load_balancing_group,
+                   ns.rw_ios_per_second, ns.rw_mbytes_per_second, ns.r_mbytes_per_second, ns.w_mbytes_per_second,
+                   rates, valid)
+
+
+class Snapshot:
+    """Result of a completed collection cycle
+
+    A new snapshot is built for every cycle and never modified once published, so it can be
+    read by renderers and exporters in other threads without taking the collector's locks. The
+    version increases by one for each published cycle, so readers can tell whether they have
+    already seen it. topology changes whenever the namespace list (or any namespace's metadata)
+    does, so per-namespace static data can be cached against it; 0 means unknown.
+    """
+
+    __slots__ = ('version', 'timestamp', 'interval', 'rows', 'topology')
+
+    def __init__(self, version: int, timestamp: float, interval: float, rows: Tuple[NamespaceRow, ...],
+                 topology: int = 0):
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, 'timestamp', timestamp)
+        object.__setattr__(self, 'interval', interval)
+        object.__setattr__(self, 'rows', rows)
+        object.__setattr__(self, 'topology', topology)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("snapshots are read-only")
+
+    def to_dict(self) -> dict:
+        """Return a JSON friendly form, with each row as a flat list in NamespaceRow field order"""
+        return {
+            'version': self.version,
+            'timestamp': self.timestamp,
+            'interval': self.interval,
+            'rows': self.rows,
+            'topology': self.topology,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Snapshot':
+        rates_idx = NamespaceRow._fields.index('rates')
+        rows = []
+        for values in data['rows']:
+            values = list(values)
+            values[rates_idx] = IORates._make(values[rates_idx])
+            rows.append(NamespaceRow._make(values))
+        return cls(data['version'], data['timestamp'], data['interval'], tuple(rows), data.get('topology', 0))
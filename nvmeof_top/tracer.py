@@ -0,0 +1,184 @@
+import threading
+import time
+import grpc
+from .grpc import GatewayClient
+import nvmeof_top.proto.gateway_pb2 as pb2
+from nvmeof_top.snapshot import Snapshot
+from typing import Callable, Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def format_event(event: Dict) -> str:
+    when = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(event['timestamp']))
+    return f"{when} SPDK nvmf trace capture {event['event']}: {event['detail']}"
+
+
+class TraceCapture:
+    """Raise the gateway's SPDK nvmf logging for a bounded window when await spikes
+
+    A namespace spikes when its read or write await exceeds spike_factor times its own quiet
+    baseline (an EWMA) and is above min_await ms. The first spike opens a capture window of
+    `window` seconds, and no new window opens until `cooldown` seconds after the last one ended.
+
+    The previous flags and levels are read before anything changes, and restored when the
+    window ends, when nvmeof-top stops, or if the capture fails part way. The gateway can only
+    switch the nvmf flags on or off as a group: if none were enabled before, they are disabled
+    again, otherwise the previous levels are put back. Only the flags are restored exactly, since
+    disabling them also resets the levels to the gateway's defaults and there is no RPC that
+    sets a level alone, so the level read back after the restore is the one reported.
+    """
+
+    baseline_alpha = 0.1
+    min_baseline_samples = 5
+
+    def __init__(self, client: GatewayClient, window: float, cooldown: float, spike_factor: float,
+                 min_await: float, level: str = 'debug'):
+        self.client = client
+        self.window = window
+        self.cooldown = cooldown
+        self.spike_factor = spike_factor
+        self.min_await = min_await
+        self.level = pb2.LogLevel.Value(level.upper())
+        self.baselines: Dict[str, List[float]] = {}
+        self.events: List[str] = []
+        self.events_lock = threading.Lock()
+        self.listeners: List[Callable[[Dict], None]] = []
+        self.captures = 0
+        self._active = False
+        self._last_end = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _spike(self, snapshot: Snapshot) -> Optional[str]:
+        """Update the baselines, returning a description of the worst spike, if any"""
+        # forget namespaces that have gone, so churn can't grow the baselines without bound
+        present = {row.bdev_name for row in snapshot.rows}
+        for bdev_name in [bdev_name for bdev_name in self.baselines if bdev_name not in present]:
+            del self.baselines[bdev_name]
+
+        worst, worst_ratio = None, 0.0
+        for row in snapshot.rows:
+            if not row.valid:
+                continue
+            await_ms = max(row.rates.r_await, row.rates.w_await)
+            baseline = self.baselines.get(row.bdev_name)
+            if baseline is None:
+                self.baselines[row.bdev_name] = [await_ms, 1]
+                continue
+            mean, samples = baseline
+            spiking = (samples >= self.min_baseline_samples and await_ms > self.min_await
+                       and await_ms > self.spike_factor * mean)
+            if spiking:
+                ratio = await_ms / mean if mean else float('inf')
+                if ratio > worst_ratio:
+                    worst, worst_ratio = f"nsid {row.nsid} await {await_ms:3.2f}ms vs baseline {mean:3.2f}ms", ratio
+            else:
+                # spikes are kept out of the baseline, so a long incident can't become normal
+                baseline[0] = mean + self.baseline_alpha * (await_ms - mean)
+                baseline[1] = samples + 1
+        return worst
+
+    def observe(self, snapshot: Snapshot):
+        """Snapshot subscriber: open a capture window on a spike, within the rate limit"""
+        reason = self._spike(snapshot)
+        if not reason or self._active or self._stop.is_set():
+            return
+        if self._last_end and time.time() - self._last_end < self.cooldown:
+            logger.info("await spike (%s) ignored, trace capture cooling down", reason)
+            return
+        self._active = True
+        self._thread = threading.Thread(target=self._capture, args=(reason,), name='trace-capture', daemon=True)
+        self._thread.start()
+
+    def _record(self, event: Dict):
+        text = format_event(event)
+        logger.warning(text)
+        with self.events_lock:
+            self.events.append(text)
+        for listener in self.listeners:
+            try:
+                listener(event)
+            except Exception:
+                logger.exception("trace capture listener failed")
+
+    def _capture(self, reason: str):
+        stub = self.client.stub
+        try:
+            previous = stub.get_spdk_nvmf_log_flags_and_level(pb2.get_spdk_nvmf_log_flags_and_level_req())
+        except grpc.RpcError as err:
+            logger.error(f"unable to read SPDK nvmf log settings, trace capture skipped: {err}")
+            self._finish()
+            return
+        if previous.status != 0:
+            logger.error(f"unable to read SPDK nvmf log settings, trace capture skipped: {previous.error_message}")
+            self._finish()
+            return
+
+        try:
+            self.captures += 1
+            status = stub.set_spdk_nvmf_logs(pb2.set_spdk_nvmf_logs_req(log_level=self.level, print_level=self.level))
+            if status.status != 0:
+                logger.error(f"unable to raise SPDK nvmf logging: {status.error_message}")
+                return
+            self._record({'event': 'start', 'timestamp': time.time(),
+                          'detail': f"{reason}, level {pb2.LogLevel.Name(self.level)} for {self.window:g}s"})
+            self._stop.wait(self.window)
+        except grpc.RpcError as err:
+            logger.error(f"unable to raise SPDK nvmf logging: {err}")
+        finally:
+            self._restore(previous)
+            self._finish()
+
+    def _restore(self, previous):
+        stub = self.client.stub
+        enabled = [flag.name for flag in previous.nvmf_log_flags if flag.enabled]
+        try:
+            if enabled:
+                status = stub.set_spdk_nvmf_logs(pb2.set_spdk_nvmf_logs_req(log_level=previous.log_level,
+                                                                            print_level=previous.log_print_level))
+            else:
+                status = stub.disable_spdk_nvmf_logs(pb2.disable_spdk_nvmf_logs_req())
+            failure = status.error_message if status.status != 0 else None
+        except grpc.RpcError as err:
+            failure = str(err)
+
+        if failure:
+            logger.critical(f"unable to restore SPDK nvmf logging, restore it by hand: {failure}")
+            detail = f"restore FAILED ({failure})"
+        else:
+            detail = f"restored flags {','.join(enabled) or 'none'}, {self._level_after(previous)}"
+        self._record({'event': 'end', 'timestamp': time.time(), 'detail': detail})
+
+    def _level_after(self, previous) -> str:
+        """Describe the log level in force after a restore, which may not be the one saved"""
+        saved = pb2.LogLevel.Name(previous.log_level)
+        try:
+            current = self.client.stub.get_spdk_nvmf_log_flags_and_level(pb2.get_spdk_nvmf_log_flags_and_level_req())
+        except grpc.RpcError as err:
+            logger.warning(f"unable to read back SPDK nvmf log level after restore: {err}")
+            current = None
+        if current is None or current.status != 0:
+            return f"level unknown (was {saved})"
+        level = pb2.LogLevel.Name(current.log_level)
+        if current.log_level != previous.log_level:
+            logger.warning(f"SPDK nvmf log level is now {level}, not {saved} as before the capture; "
+                           "the gateway cannot set the level without enabling the flags")
+            return f"level {level} (was {saved})"
+        return f"level {level}"
+
+    def _finish(self):
+        self._last_end = time.time()
+        self._active = False
+
+    def drain_events(self) -> List[str]:
+        with self.events_lock:
+            events, self.events = self.events, []
+        return events
+
+    def stop(self):
+        """End any open window early, waiting for the previous settings to be restored"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=10)
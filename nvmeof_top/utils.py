@@ -1,6 +1,11 @@
+import math
+import os
+import resource
 import uuid
 import regex
 import argparse
+import datetime
+from typing import List, Tuple
 
 
 def lb_group(grp_id: int):
@@ -13,6 +18,115 @@ def bytes_to_MB(bytes: int, si: int = 1024):
     return (bytes / si) / si
 
 
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a sorted list"""
+    if not values:
+        return 0.0
+    rank = max(1, math.ceil((pct / 100) * len(values)))
+    return values[rank - 1]
+
+
+def rss_bytes() -> int:
+    """Current resident set size of this process"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # not linux, so fall back to the peak RSS (reported in KiB)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def positive_float(value: str) -> float:
+    """argparse type for intervals, which may be fractional but must be above zero"""
+    try:
+        number = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value} is not a number")
+    if number <= 0:
+        raise argparse.ArgumentTypeError("value must be greater than 0")
+    return number
+
+
+def timestamp(value: str) -> float:
+    """argparse type for a point in time, as epoch seconds or local 'YYYY-MM-DD[ HH:MM[:SS]]'"""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value} is not epoch seconds or a 'YYYY-MM-DD HH:MM:SS' time")
+
+
+def time_window(value: str) -> Tuple[float, float]:
+    """argparse type for a START,END time range, each in a form accepted by timestamp()"""
+    times = value.split(',')
+    if len(times) != 2:
+        raise argparse.ArgumentTypeError("a window must be given as START,END")
+    start, end = timestamp(times[0].strip()), timestamp(times[1].strip())
+    if start >= end:
+        raise argparse.ArgumentTypeError("a window must start before it ends")
+    return start, end
+
+
+def positive_int(value: str) -> int:
+    """argparse type for counts and limits that must be at least 1"""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value} is not an integer")
+    if number < 1:
+        raise argparse.ArgumentTypeError("value must be at least 1")
+    return number
+
+
+def non_negative_int(value: str) -> int:
+    """argparse type for limits where 0 means no limit"""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value} is not an integer")
+    if number < 0:
+        raise argparse.ArgumentTypeError("value must not be negative")
+    return number
+
+
+def concurrency_limit(value: str) -> int:
+    """argparse type for the RPC concurrency, either 'auto' (returned as 0) or a positive integer"""
+    if value == 'auto':
+        return 0
+    try:
+        limit = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("concurrency must be 'auto' or an integer")
+    if limit < 1:
+        raise argparse.ArgumentTypeError("concurrency must be at least 1")
+    return limit
+
+
+def nsid_list(value: str) -> List[int]:
+    """argparse type for a comma separated list of namespace ids"""
+    try:
+        nsids = [int(nsid) for nsid in value.split(',') if nsid.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError("namespace ids must be a comma separated list of integers")
+    if not nsids or any(nsid < 1 for nsid in nsids):
+        raise argparse.ArgumentTypeError("namespace ids must be 1 or more")
+    return nsids
+
+
+def valid_pattern(pattern: str) -> str:
+    """argparse type for namespace selector patterns, rejecting invalid regular expressions"""
+    if not pattern.startswith('re:'):
+        return pattern
+    try:
+        regex.compile(pattern[3:])
+    except regex.error as err:
+        raise argparse.ArgumentTypeError(f"invalid pattern '{pattern}': {err}")
+    return pattern
+
+
 def valid_nqn(nqn: str) -> str:
     """Perform basic validation on the nqn string"""
     # Examples:
@@ -0,0 +1,337 @@
+import base64
+import hashlib
+import json
+import os
+import struct
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+from nvmeof_top.render import qos_enabled
+from nvmeof_top.snapshot import IORates, Snapshot
+from nvmeof_top.utils import bytes_to_MB, lb_group
+from typing import Deque, Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+page_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dashboard.html')
+
+# RFC 6455 handshake constant
+_ws_guid = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+_op_text, _op_close, _op_ping, _op_pong = 0x1, 0x8, 0x9, 0xA
+# viewers only ever send control frames, so anything bigger is not a viewer
+_max_incoming = 4096
+
+columns = ['IOPS', 'r/s', 'rMB/s', 'r_await', 'rareq-sz', 'w/s', 'wMB/s', 'w_await', 'wareq-sz']
+
+
+def _frame(payload: bytes, opcode: int = _op_text) -> bytes:
+    """Encode a single, unmasked server to client frame"""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+
+def _encode(message: Dict) -> bytes:
+    return _frame(json.dumps(message, separators=(',', ':')).encode())
+
+
+def _cells(rates: IORates) -> List:
+    """The batch mode columns, at the precision batch mode shows them"""
+    return [int(rates.total_iops), int(rates.read_ops), round(bytes_to_MB(rates.read_bytes), 2), round(rates.r_await, 2),
+            round(rates.rareq_sz, 2), int(rates.write_ops), round(bytes_to_MB(rates.write_bytes), 2),
+            round(rates.w_await, 2), round(rates.wareq_sz, 2)]
+
+
+def _changes(old: Dict, new: Dict) -> Dict:
+    return {key: value for key, value in new.items() if old.get(key, ()) != value}
+
+
+class _Viewer:
+    """Feed one websocket viewer from its own thread
+
+    Deltas only make sense applied in order, so when a viewer falls max_pending frames behind
+    its queue is discarded and it is sent the full state instead.
+    """
+
+    max_pending = 4
+
+    def __init__(self, conn, dashboard: 'Dashboard'):
+        self.conn = conn
+        self.dashboard = dashboard
+        self.cond = threading.Condition()
+        self.pending: Deque[bytes] = deque()
+        # a new viewer starts with the full state
+        self.resync = True
+        self.closed = False
+        self.resyncs = 0
+        self._thread = threading.Thread(target=self._run, name='web-viewer', daemon=True)
+        self._thread.start()
+
+    def send(self, frame: bytes):
+        with self.cond:
+            if self.resync:
+                # the state it will be sent covers this frame
+                return
+            if len(self.pending) >= self.max_pending:
+                self.pending.clear()
+                self.resync = True
+                self.resyncs += 1
+            else:
+                self.pending.append(frame)
+            self.cond.notify()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        self._thread.join(timeout=1)
+
+    def _next(self) -> Optional[bytes]:
+        with self.cond:
+            while not (self.pending or self.resync or self.closed):
+                self.cond.wait()
+            if self.pending and not self.resync:
+                return self.pending.popleft()
+            if self.closed:
+                return None
+        # taken under the dashboard lock, so no delta older than the state can be left queued
+        with self.dashboard.lock:
+            frame = self.dashboard.state_frame()
+            with self.cond:
+                self.pending.clear()
+                self.resync = False
+        return frame
+
+    def _run(self):
+        try:
+            while True:
+                frame = self._next()
+                if frame is None:
+                    return
+                self.conn.sendall(frame)
+        except OSError as err:
+            logger.info(f"web viewer disconnected: {err}")
+        finally:
+            self.dashboard.remove(self)
+
+
+class Dashboard:
+    """Browser dashboard of the live table, IOPS sparklines and pool/LB group roll-ups
+
+    GET / serves the page, which connects back to /ws. Each viewer receives the full state once,
+    then one delta per cycle holding only the namespaces, static fields and roll-ups whose
+    shown values changed. The delta is serialised once per cycle and the same bytes queued for
+    every viewer, so viewers add no gateway RPCs and next to no work per cycle.
+    """
+
+    spark_points = 60
+
+    def __init__(self, subsystem: str, addr: str, port: int):
+        self.subsystem = subsystem
+        self.addr = addr
+        self.port = port
+        self.lock = threading.Lock()
+        self.viewers: List[_Viewer] = []
+        self.cycle = 0
+        self.timestamp = 0.0
+        self.interval = 0.0
+        self.topology = 0
+        self.meta: Dict[str, List] = {}
+        self.rows: Dict[str, Optional[List]] = {}
+        self.sparks: Dict[str, Deque[Optional[int]]] = {}
+        self.rollups: Dict[str, Dict[str, List]] = {'pools': {}, 'lbgroups': {}}
+        self._state: Optional[bytes] = None
+        self._page = b''
+        self._httpd: Optional[ThreadingHTTPServer] = None
+
+    def start(self):
+        with open(page_file, 'rb') as page:
+            self._page = page.read()
+        dashboard = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # RFC 6455 needs an HTTP/1.1 101 response to the upgrade
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                if self.path == '/ws':
+                    dashboard.serve_viewer(self)
+                elif self.path in ('/', '/index.html'):
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/html; charset=utf-8')
+                    self.send_header('Content-Length', str(len(dashboard._page)))
+                    self.end_headers()
+                    self.wfile.write(dashboard._page)
+                else:
+                    self.send_error(404)
+
+            def log_message(self, format, *args):
+                logger.debug("%s " + format, self.address_string(), *args)
+
+        self._httpd = ThreadingHTTPServer((self.addr, self.port), Handler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        threading.Thread(target=self._httpd.serve_forever, name='web-dashboard', daemon=True).start()
+        logger.info(f"web dashboard on http://{self.addr}:{self.port}/")
+
+    def stop(self):
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+        with self.lock:
+            viewers = list(self.viewers)
+        for viewer in viewers:
+            viewer.send(_frame(b'', _op_close))
+            viewer.close()
+
+    def remove(self, viewer: _Viewer):
+        with self.lock:
+            if viewer in self.viewers:
+                self.viewers.remove(viewer)
+
+    def serve_viewer(self, handler: BaseHTTPRequestHandler):
+        """Complete the websocket handshake, then read the viewer's frames until it goes away
+
+        Browsers let any page open a websocket to any host, so a handshake whose Origin is not
+        the dashboard's own host is refused. Clients that send no Origin are not browsers.
+        """
+        key = handler.headers.get('Sec-WebSocket-Key')
+        if handler.headers.get('Upgrade', '').lower() != 'websocket' or not key:
+            handler.send_error(400, "expected a websocket upgrade")
+            return
+        origin = handler.headers.get('Origin')
+        if origin is not None and urlsplit(origin).netloc.lower() != handler.headers.get('Host', '').lower():
+            logger.warning("web viewer %s refused, origin %s does not match the dashboard",
+                           handler.address_string(), origin)
+            handler.send_error(403, "cross origin websocket refused")
+            return
+        accept = base64.b64encode(hashlib.sha1(key.encode() + _ws_guid).digest()).decode()
+        handler.send_response(101)
+        handler.send_header('Upgrade', 'websocket')
+        handler.send_header('Connection', 'Upgrade')
+        handler.send_header('Sec-WebSocket-Accept', accept)
+        handler.end_headers()
+        handler.wfile.flush()
+        handler.close_connection = True
+
+        viewer = _Viewer(handler.connection, self)
+        with self.lock:
+            self.viewers.append(viewer)
+            count = len(self.viewers)
+        logger.info(f"web viewer {handler.address_string()} connected, {count} connected")
+        try:
+            self._read_frames(handler.rfile, viewer)
+        except (OSError, ValueError) as err:
+            logger.info(f"web viewer {handler.address_string()} dropped: {err}")
+        finally:
+            viewer.close()
+            self.remove(viewer)
+
+    @staticmethod
+    def _read_frames(stream, viewer: _Viewer):
+        while True:
+            header = stream.read(2)
+            if len(header) < 2:
+                return
+            opcode, length = header[0] & 0x0F, header[1] & 0x7F
+            if length == 126:
+                length = struct.unpack('!H', stream.read(2))[0]
+            elif length == 127:
+                length = struct.unpack('!Q', stream.read(8))[0]
+            if length > _max_incoming:
+                raise ValueError(f"{length} byte frame from a viewer")
+            mask = stream.read(4) if header[1] & 0x80 else b''
+            payload = stream.read(length)
+            if mask:
+                payload = bytes(byte ^ mask[idx % 4] for idx, byte in enumerate(payload))
+            if opcode == _op_close:
+                viewer.send(_frame(payload[:2], _op_close))
+                return
+            if opcode == _op_ping:
+                viewer.send(_frame(payload, _op_pong))
+
+    def state_frame(self) -> bytes:
+        """The full state as of the latest cycle, serialised once per cycle (call with lock held)"""
+        if self._state is None:
+            self._state = _encode({
+                'type': 'state',
+                'subsystem': self.subsystem,
+                'columns': columns,
+                'cycle': self.cycle,
+                'timestamp': self.timestamp,
+                'interval': self.interval,
+                'meta': self.meta,
+                'rows': self.rows,
+                'sparks': {bdev: list(points) for bdev, points in self.sparks.items()},
+                'pools': self.rollups['pools'],
+                'lbgroups': self.rollups['lbgroups'],
+            })
+        return self._state
+
+    def observe(self, snapshot: Snapshot):
+        """Fold a snapshot into the dashboard state, and queue its delta for every viewer"""
+        trusted = snapshot.topology and snapshot.topology == self.topology
+        meta, rows = {}, {}
+        sums: Dict[str, Dict[str, List]] = {'pools': {}, 'lbgroups': {}}
+        for row in snapshot.rows:
+            if not trusted or row.bdev_name not in self.meta:
+                meta[row.bdev_name] = [row.nsid, row.rbd_pool_name, row.rbd_image_name,
+                                       lb_group(row.load_balancing_group), qos_enabled(row)]
+            rows[row.bdev_name] = _cells(row.rates) if row.valid else None
+            if row.valid:
+                for scope, key in (('pools', row.rbd_pool_name), ('lbgroups', lb_group(row.load_balancing_group))):
+                    totals = sums[scope].setdefault(key, [0, [0.0] * 6])
+                    totals[0] += 1
+                    totals[1] = [total + rate for total, rate in zip(totals[1], row.rates)]
+        rollups = {scope: {key: [count] + _cells(IORates(*totals)) for key, (count, totals) in groups.items()}
+                   for scope, groups in sums.items()}
+
+        with self.lock:
+            removed = [bdev for bdev in self.meta if bdev not in rows]
+            for bdev in removed:
+                del self.meta[bdev]
+                del self.sparks[bdev]
+            meta = _changes(self.meta, meta)
+            self.meta.update(meta)
+            changed = _changes(self.rows, rows)
+            for bdev, cells in rows.items():
+                points = self.sparks.get(bdev)
+                if points is None:
+                    points = self.sparks[bdev] = deque(maxlen=self.spark_points)
+                points.append(cells[0] if cells else None)
+            delta = {
+                'type': 'delta',
+                'cycle': snapshot.version,
+                'timestamp': snapshot.timestamp,
+                'interval': snapshot.interval,
+                'viewers': len(self.viewers),
+            }
+            if meta:
+                delta['meta'] = meta
+            if removed:
+                delta['removed'] = removed
+            if changed:
+                delta['rows'] = changed
+            for scope, groups in rollups.items():
+                gone = [key for key in self.rollups[scope] if key not in groups]
+                if gone:
+                    delta[f"{scope}_removed"] = gone
+                groups_changed = _changes(self.rollups[scope], groups)
+                if groups_changed:
+                    delta[scope] = groups_changed
+            self.rows = rows
+            self.rollups = rollups
+            self.cycle, self.timestamp, self.interval = snapshot.version, snapshot.timestamp, snapshot.interval
+            self.topology = snapshot.topology
+            self._state = None
+            frame = _encode(delta)
+            for viewer in self.viewers:
+                viewer.send(frame)